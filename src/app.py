@@ -1,21 +1,26 @@
 #!/opt/homebrew/Caskroom/miniconda/base/bin/python
+import time
+STARTED_AT = time.perf_counter()
+
 import logging
 from typing import Optional
 import wx
-from wx.adv import TBI_DEFAULT_TYPE, TaskBarIcon, TBI_DOCK, TBI_CUSTOM_STATUSITEM
-import requests
-import time
-import datetime
-import webbrowser
+import math
 from urllib.parse import urlencode
 import sys
 
 import settings
-from login_frame import LoginFrame
+from startup_profiler import startup_profiler
+from metrics import metrics
 from base_frame import BaseFrame
-from lock_frame import LockFrame
-from models import Task
+from models import Task, User
 from canvas import Canvas
+from task_list import TaskListCtrl, format_task_label
+from sync import SyncResult
+from task_store import TaskChanges
+from task_index import DONE, IN_PROGRESS, NOT_STARTED, OVERDUE, THIS_WEEK, TODAY, TaskIndex
+from engine import Engine, EngineListener
+from tomato import TomatoState
 
 
 logger = logging.getLogger(__name__)
@@ -23,7 +28,19 @@ logger = logging.getLogger(__name__)
 main_frame = None
 
 
-class MainFrame(BaseFrame):
+class MainFrame(BaseFrame, EngineListener):
+    ''' View over the Engine: task list, countdown canvas and the tomato button '''
+
+    # label, deadline bucket, progress bucket of the filter choice
+    FILTER_BUCKETS = [
+        ("全部", None, None),
+        ("已过期", OVERDUE, None),
+        ("今天截止", TODAY, None),
+        ("本周截止", THIS_WEEK, None),
+        ("未开始", None, NOT_STARTED),
+        ("进行中", None, IN_PROGRESS),
+        ("已完成", None, DONE),
+    ]
 
     def __init__(self, *args, **kw):
         global main_frame 
@@ -32,31 +49,50 @@ class MainFrame(BaseFrame):
 
         main_frame = self
 
-        # initial ui
-        self.taskbar_icon = MyTaskBarIcon(self)
+        # initial ui, the tray icon is created once the window is up
+        self.taskbar_icon = None
+        wx.CallAfter(self.initial_taskbar_icon)
+        wx.CallAfter(self.initial_audio)
 
         box = wx.BoxSizer(orient=wx.HORIZONTAL)
 
-        self.tree_ctrl = wx.TreeCtrl(self)
-        self.tree_ctrl.SetMinSize((-1, settings.APP_SIZE[1]))
-        self.tree_ctrl.Bind(wx.EVT_TREE_SEL_CHANGED, self.on_tree_sel_changed)
-        box.Add(self.tree_ctrl, wx.ALL|wx.EXPAND)
+        list_vbox = wx.BoxSizer(orient=wx.VERTICAL)
+        filter_hbox = wx.BoxSizer(orient=wx.HORIZONTAL)
+        self.search_ctrl = wx.SearchCtrl(self, style=wx.TE_PROCESS_ENTER)
+        self.search_ctrl.SetDescriptiveText("搜索作业或项目")
+        self.search_ctrl.ShowCancelButton(True)
+        self.search_ctrl.Bind(wx.EVT_TEXT, self.on_filter_changed)
+        self.search_ctrl.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self.on_search_cancel)
+        filter_hbox.Add(self.search_ctrl, proportion=1, flag=wx.EXPAND)
+        self.bucket_choice = wx.Choice(self, choices=[x[0] for x in self.FILTER_BUCKETS])
+        self.bucket_choice.SetSelection(0)
+        self.bucket_choice.Bind(wx.EVT_CHOICE, self.on_filter_changed)
+        filter_hbox.Add(self.bucket_choice)
+        list_vbox.Add(filter_hbox, flag=wx.EXPAND)
+
+        self.task_list = TaskListCtrl(self, '作业列表')
+        self.task_list.SetMinSize((-1, settings.APP_SIZE[1] - self.search_ctrl.GetBestSize()[1]))
+        self.task_list.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_task_selected)
+        list_vbox.Add(self.task_list, proportion=1, flag=wx.EXPAND)
+        box.Add(list_vbox, wx.ALL|wx.EXPAND)
+        # ids of the tasks shown, None shows all
+        self.filter_ids = None
 
         self.lock_frame = None
-        self.lock_timer = wx.Timer(self)
-        self.lock_listen_task_id = 0
-        self.lock_start_time = None
         self.lock_frame_size = None
+        self.countdown_handle = None
 
-        self.last_sync_task_time = None
-        self.countdown_seconds = 0
-        self.countdown_timer = wx.Timer(self)
-        self.Bind(wx.EVT_TIMER, self.on_countdown, self.countdown_timer)
+        # hidden to the tray or iconized: no ui refresh, slower sync
+        self.background = False
+        self.Bind(wx.EVT_SHOW, self.on_show)
+        self.Bind(wx.EVT_ICONIZE, self.on_iconize)
 
         self.panel = wx.Panel(self)
         panel_vbox = wx.BoxSizer(orient=wx.VERTICAL)
         self.canvas = Canvas(self.panel, 25*60, self.BG_COLOR, "🍅")
         self.canvas.SetMinSize((-1, settings.APP_SIZE[1] - 200))
+        if startup_profiler.enabled:
+            self.canvas.Bind(wx.EVT_PAINT, self.on_first_paint)
         panel_vbox.Add(self.canvas, flag=wx.EXPAND)
 
         panel_vbox.Add(0, 10)
@@ -81,201 +117,272 @@ class MainFrame(BaseFrame):
         self.SetSizer(box)
         self.Center(wx.BOTH)
 
-        self.tasks: list[Task] = []
+        self.client.on_error = self.set_error_tips
+        self.engine = Engine(self.client, self.scheduler, wx.CallAfter)
+        self.task_store = self.engine.task_store
+        # subscribed first, so the list reads an index up to date
+        self.task_index = TaskIndex(self.task_store)
+        self.task_store.subscribe(self.on_tasks_changed)
+        self.engine.subscribe(self)
+        self.Bind(wx.EVT_CLOSE, self.on_close)
 
         # initial data
-        self.initial_token()
-        self.sync_tasks()
-        self.initial_tree()
-        self.initial_lock_timer()
+        self.engine.start()
+        self.initial_task_list()
         self.initial_tomato_btn()
-        self.countdown_timer.Start(1000)
 
         if not self.is_logined():
+            from login_frame import LoginFrame
             LoginFrame(self, self, title="Login")
         else:
             self.Show()
+        startup_profiler.mark("window build")
 
     @classmethod
     def get_default(cls):
         global main_frame
         return main_frame
 
-    def on_countdown(self, event):
-        self.sync_tasks()
-        
-        if self.lock_listen_task_id:
-            task = self.find_task(self.lock_listen_task_id)
-            if not task:
-                self.lock_listen_task_id = 0
-            else:
-                if self.countdown_seconds > 0:
-                    self.countdown_seconds -= 1
-                    self.canvas.update(self.countdown_seconds, self.format_seconds(self.countdown_seconds))
-                logger.info(f"countdown seconds {self.countdown_seconds}")
-                task.opening_tomato_left_seconds = self.countdown_seconds
+    def initial_taskbar_icon(self):
+        from tray import MyTaskBarIcon
+        self.taskbar_icon = MyTaskBarIcon(self)
 
-        
-        self.initial_tree()
-        self.initial_lock_timer()
+    def initial_audio(self):
+        ''' Load the cues once the window is up so playing them later costs nothing '''
+        from audio import AudioService
+        AudioService(self).preload([settings.TOMATO_DONE_MP3, settings.REST_DONE_MP3, settings.TOMATO_START_MP3])
+
+    def on_first_paint(self, event):
+        event.Skip()
+        self.canvas.Unbind(wx.EVT_PAINT, handler=self.on_first_paint)
+        startup_profiler.mark("first paint")
+
+    def on_login(self):
+        self.engine.sync_tasks(sync_interval_seconds=0)
+
+    def on_close(self, event):
+        self.discard_lock_frame()
+        self.engine.unsubscribe(self)
+        self.engine.close()
+        event.Skip()
+
+    def dump_metrics(self):
+        from audio import AudioService
+        audio = AudioService.get_default()
+        metrics.dump(
+            settings.METRICS_PATH,
+            app_build=settings.APP_BUILD,
+            app_platform=settings.APP_PLATFORM,
+            app_version=settings.APP_VERSION,
+            tasks=len(self.task_store),
+            startup_ms=startup_profiler.phases,
+            audio=audio.metrics() if audio else {},
+        )
+        self.set_tips(f"性能数据已导出到 {settings.METRICS_PATH}")
+
+    def on_show(self, event):
+        event.Skip()
+        self.set_background(not event.IsShown())
+
+    def on_iconize(self, event):
+        event.Skip()
+        self.set_background(event.IsIconized())
+
+    def set_background(self, background):
+        ''' In background only the deadlines and a slower sync keep running, showing catches the view up in one pass '''
+        if background == self.background:
+            return
+        self.background = background
+        logger.info(f"background mode {background}")
+
+        self.engine.set_background(background)
+        if background:
+            self.scheduler.cancel(self.countdown_handle)
+            self.countdown_handle = None
+            return
+
+        self.initial_task_list()
+        self.refresh_countdown()
         self.initial_tomato_btn()
 
-    def get_tasks(self, page=1, page_size=100) -> list[Task]:
-        url = self.pack_url("/mobile/task/my/")
-        params = {
-            'status': 1,
-            "order": "-id",
-            "page": page,
-            "page_size": page_size,
-        }
-        r = self.request("GET", url, params=params)
-        if not r:
-            return []
-        data = r.json()
-        if data['is_ok'] is False:
-            self.set_error_tips(data['reason'])
-            return []
-        
-        tasks = []
-        for item in r.json()['tasks']:
-            task = Task(
-                id=item['id'],
-                title=item['title'],
-                status=item['status'],
-                tomato_minute=item['tomato_minute'],
-                project=item['project'],
-                opening_tomato_id=item['opening_tomato_id'],
-                opening_tomato_left_seconds=item['opening_tomato_left_seconds'],
-                last_update_datetime=item['last_update_datetime'],
-                tomato_number=item['tomato_number'],
-                expect_tomato_number=item['expect_tomato_number'],
-                dead_datetime=item['dead_datetime']
-            )
-            tasks.append(task)
-        return tasks
-    
+    def on_countdown(self):
+        ''' Runs each time the displayed second of the opening tomato changes '''
+        if metrics.enabled:
+            metrics.record("countdown lag", (self.scheduler.clock() - self.countdown_handle.deadline) * 1000)
+        self.countdown_handle = None
+        self.refresh_countdown()
+
+    def refresh_countdown(self):
+        ''' Redraw the countdown now, the pending tick is replaced by the next one '''
+        self.scheduler.cancel(self.countdown_handle)
+        self.countdown_handle = None
+        if not self.engine.lock_listen_task_id or self.background:
+            return
+
+        task = self.find_task(self.engine.lock_listen_task_id)
+        if not task:
+            self.engine.stop_lock_listen()
+            return
+
+        left_seconds = self.engine.lock_left_seconds()
+        self.canvas.update(left_seconds, self.format_seconds(left_seconds))
+        # the seconds are read from the deadline, the task itself is not changed
+        task.label = None
+        self.task_list.refresh_labels([task], self.format_task_label)
+        self.initial_tomato_btn()
+        self.schedule_countdown()
+
+    def opening_left_seconds(self, task: Task) -> int:
+        return self.engine.opening_left_seconds(task)
+
+    def schedule_countdown(self):
+        ''' Wake up when the displayed second changes, computed from the deadline so it never drifts '''
+        deadline = self.engine.lock_deadline
+        if self.countdown_handle or deadline is None:
+            return
+        remaining = deadline - self.scheduler.clock()
+        if remaining <= 0:
+            return
+        self.countdown_handle = self.call_at(deadline - (math.ceil(remaining) - 1), self.on_countdown)
+
     def get_opening_task(self) -> Optional[Task]:
-        for task in self.tasks:
-            if task.opening_tomato_id > 0:
-                return task
-            
-        return None
+        return self.engine.get_opening_task()
     
-    def initial_tree(self):
-        selected_task = self.get_selected_task()
-
-        self.tree_ctrl.DeleteAllItems()
-        self.tree_ctrl.AddRoot('作业列表')
-        root = self.tree_ctrl.RootItem
-
-        for task in self.tasks:
-            if task.opening_tomato_id > 0:
-                title = f"{task.title}: {task.tomato_number}/{task.expect_tomato_number}🍅 - 开番{self.format_seconds(task.opening_tomato_left_seconds)}"
-            else:
-                title = f"{task.title}: {task.tomato_number}/{task.expect_tomato_number}🍅，{task.dead_datetime}截止"
-            item = self.tree_ctrl.AppendItem(root, title, data=task.id)
-            if selected_task and selected_task.id == task.id:
-                self.tree_ctrl.SelectItem(item)
-        
-        self.tree_ctrl.ExpandAll()
+    def initial_task_list(self):
+        ''' Only rows whose label changed are redrawn '''
+        self.filter_ids = self.current_filter()
+        self.task_list.set_tasks(self.filtered_tasks(), self.format_task_label)
+
+    def current_filter(self) -> Optional[set[int]]:
+        _, deadline, progress = self.FILTER_BUCKETS[self.bucket_choice.GetSelection()]
+        return self.task_index.filter(self.search_ctrl.GetValue(), deadline, progress)
+
+    def filtered_tasks(self):
+        if self.filter_ids is None:
+            return self.task_store
+        return (x for x in self.task_store if x.id in self.filter_ids)
+
+    def on_filter_changed(self, event):
+        event.Skip()
+        started = time.perf_counter()
+        self.initial_task_list()
+        if metrics.enabled:
+            metrics.record_ms("filter", started)
+        self.initial_tomato_btn()
+
+    def on_search_cancel(self, event):
+        self.search_ctrl.ChangeValue("")
+        self.on_filter_changed(event)
 
-    def on_tree_sel_changed(self, event):
-        # Get the item that was activated
-        item = event.GetItem()
-        item_text = self.tree_ctrl.GetItemText(item)
-        item_task_id = self.tree_ctrl.GetItemData(item)
+    def on_tasks_changed(self, changes: TaskChanges):
+        if self.background:
+            return
+        if self.filter_ids is None:
+            self.task_list.apply_changes(changes, self.task_store, self.format_task_label)
+        elif changes.reordered or self.current_filter() != self.filter_ids:
+            # the changed tasks entered or left the filter
+            self.initial_task_list()
+        else:
+            self.task_list.apply_changes(changes, self.task_store, self.format_task_label)
+        self.initial_tomato_btn()
+
+    def format_task_label(self, task: Task) -> str:
+        ''' Cached on the task until one of its fields changes '''
+        if task.label is None:
+            task.label = format_task_label(task, self.opening_left_seconds(task))
+        return task.label
+
+    def on_task_selected(self, event):
+        event.Skip()
+        item_task_id = self.task_list.model.task_id(event.GetIndex())
         task = self.find_task(item_task_id)
         if not task:
             self.SetTitle(settings.APP_NAME)
             return
-        # Print the text of the activated item
-        logger.info(f"select item: {item_text}")
+        logger.info(f"select item: {task.title}")
+        # the list records the selection after this handler
+        wx.CallAfter(self.initial_tomato_btn)
 
         # render panel
-        if task.opening_tomato_id > 0 and self.lock_start_time:
-            self.SetTitle(f"{task.title} - 定时器将在{self.lock_start_time.strftime('%H:%M:%S')}启动占屏，强制休息")
+        if task.opening_tomato_id > 0 and self.engine.lock_start_time:
+            self.SetTitle(f"{task.title} - 定时器将在{self.engine.lock_start_time.strftime('%H:%M:%S')}启动占屏，强制休息")
         else:
             self.SetTitle(task.title)
 
     def find_task(self, task_id) -> Optional[Task]:
-        for task in self.tasks:
-            if task.id == task_id:
-                return task
-            
-            return None
+        return self.task_store.get(task_id)
+
+    def on_lock_armed(self, task: Task):
+        self.canvas.set_seconds(task.tomato_minute*60)
+        self.refresh_countdown()
+
+    def on_lock_prepare(self, task: Task, user: Optional[User]):
+        self.discard_lock_frame()
+        self.lock_frame = self.create_lock_frame(task, user)
+        from audio import AudioService
+        audio = AudioService.get_default()
+        if audio:
+            audio.preload([settings.TOMATO_DONE_MP3, settings.REST_DONE_MP3])
+
+    def on_lock_cancelled(self):
+        self.discard_lock_frame()
+
+    def on_lock_stopped(self):
+        self.scheduler.cancel(self.countdown_handle)
+        self.countdown_handle = None
+        self.initial_tomato_btn()
 
-    def initial_lock_timer(self):
-        if self.lock_listen_task_id > 0:
-            return
-        opening_task = self.get_opening_task()
-        if not opening_task:
-            return
-        
-        if opening_task.opening_tomato_left_seconds <= 1:
-            return
-        
-        if opening_task.id != self.lock_listen_task_id and self.lock_listen_task_id > 0:
-            return
-        
-        self.lock_listen_task_id = opening_task.id
-        wait_seconds = int(opening_task.opening_tomato_left_seconds)
-        #wait_seconds = 5
-        logger.info(f"wait seconds {wait_seconds}")
-        self.countdown_seconds = wait_seconds
-        self.lock_start_time = datetime.datetime.now() + datetime.timedelta(seconds=wait_seconds)
-        self.Bind(wx.EVT_TIMER, self.start_lock, self.lock_timer)
-        self.lock_timer.StartOnce(wait_seconds*1000)
-        self.canvas.set_seconds(opening_task.tomato_minute*60)
-
-    def start_lock(self, event):
-        screen_width, screen_height = wx.DisplaySize()
+    def on_lock_due(self, task: Task):
+        if not self.lock_frame or self.lock_frame.task.id != task.id:
+            # not prepared in time, rest with the default length
+            self.discard_lock_frame()
+            self.lock_frame = self.create_lock_frame(task, None)
+        lock_frame, self.lock_frame = self.lock_frame, None
+        lock_frame.start()
+
+    def create_lock_frame(self, task: Task, user: Optional[User]):
+        ''' Hidden, sized for the display the main window is on '''
+        display = wx.Display.GetFromWindow(self)
+        area = wx.Display(display if display != wx.NOT_FOUND else 0).GetGeometry()
         ratio = 0.68
-        width = int(screen_width * ratio)
-        height = int(screen_height * ratio)
+        width = int(area.width * ratio)
+        height = int(area.height * ratio)
         self.lock_frame_size = (width, height)
-        task = self.find_task(self.lock_listen_task_id)
-        self.lock_frame = LockFrame(task, self, size=(width, height), style=wx.SYSTEM_MENU | wx.STAY_ON_TOP)
+        from lock_frame import LockFrame
+        return LockFrame(task, user, self, size=(width, height), style=wx.SYSTEM_MENU | wx.STAY_ON_TOP)
 
-        self.lock_listen_task_id = 0
+    def discard_lock_frame(self):
+        if self.lock_frame:
+            self.lock_frame.Destroy()
         self.lock_frame = None
-        self.lock_start_time = None
-        self.lock_timer.Stop()
-
-    def sync_tasks(self, sync_interval_seconds=30) -> bool:
-        if self.last_sync_task_time:
-            interval = datetime.datetime.now() - self.last_sync_task_time
-            if interval.total_seconds() <= sync_interval_seconds:
-                logger.info(f"interval {interval.total_seconds()} seconds is less than {sync_interval_seconds}, abort")
-                return False
-        
-        if self.lock_listen_task_id > 0:
-            logger.info(f"lock listen task id {self.lock_listen_task_id} is exists, abort")
-            return False
-        
-        tasks = self.get_tasks()
-        # merge new tasks
-        old_id_tasks_map = {x.id: x for x in self.tasks}
-        id_tasks_map = {x.id: x for x in tasks}
-        old_id_tasks_map.update(id_tasks_map)
-        
-        self.tasks = sorted(old_id_tasks_map.values(), key=lambda x: x.last_update_datetime, reverse=True)
-        self.last_sync_task_time = datetime.datetime.now()
-        return True
+
+    def on_synced(self, result: Optional[SyncResult]):
+        startup_profiler.mark("first sync")
+        startup_profiler.report(settings.WORK_DIR / "startup_profile.json")
+        self.initial_tomato_btn()
+
+    def on_tips(self, msg):
+        self.set_tips(msg)
 
     def initial_tomato_btn(self):
+        if self.background:
+            return
         task = self.get_selected_task()
         if not task:
             self.tomato_btn.SetLabel('开番')
             return
-        
-        if task.opening_tomato_id <= 0:
+
+        state = self.engine.tomato_state(task)
+        if state is TomatoState.IDLE:
             self.tomato_btn.SetLabel('开番')
             return
         
-        if task.opening_tomato_left_seconds > 0:
-            self.tomato_btn.SetLabel(f"放弃 {self.format_seconds(task.opening_tomato_left_seconds)}")
+        if state is TomatoState.RUNNING:
+            self.tomato_btn.SetLabel(f"放弃 {self.format_seconds(self.opening_left_seconds(task))}")
             # self.tomato_btn.SetBackgroundColour((0xf0, 0xad, 0x4e, 0))
             # self.tomato_btn.SetForegroundColour((255, 255, 255))
+        elif state is TomatoState.CREATED:
+            self.tomato_btn.SetLabel('放弃')
         else:
             self.tomato_btn.SetLabel('收割')
 
@@ -283,34 +390,16 @@ class MainFrame(BaseFrame):
         task = self.get_selected_task()
         if not task:
             return
-        
-        if task.opening_tomato_id <= 0:
-            tomato_id = self.create_tomato(task)
-            task.opening_tomato_id = tomato_id
-            resp = self.start_tomato(task)
-            if resp['is_ok']:
-                self.play_music(str(settings.TOMATO_START_MP3))
-        else:
-            if task.opening_tomato_left_seconds > 0: 
-                abandon_count = self.abandon_tomato(task)
-                if abandon_count > 0:
-                    self.set_tips(f'已经累计放弃了 {abandon_count} 次')
-                    self.lock_timer.Stop()
-                    self.lock_start_time = None
-                    self.lock_listen_task_id = 0
-                    self.countdown_seconds = 0
-            else:
-                self.harvest_tomato(task)
-
-        self.sync_tasks(sync_interval_seconds=0)
+
+        if self.engine.toggle_tomato(task) == 'start':
+            self.play_music(str(settings.TOMATO_START_MP3))
 
     def get_selected_task(self) -> Optional[Task]:
-        selected_item = self.tree_ctrl.GetSelection()
-        if selected_item.IsOk() is False:
+        task_id = self.task_list.get_selected_task_id()
+        if task_id is None:
             self.set_error_tips("还没有选中任何作业")
             return None
         
-        task_id = self.tree_ctrl.GetItemData(selected_item)
         task = self.find_task(task_id)
         if not task:
             self.set_error_tips("请先选择一项作业")
@@ -324,152 +413,24 @@ class MainFrame(BaseFrame):
         if not task:
             return
 
+        import webbrowser
         url = self.pack_url(f"/task/info/{task.id}/?" + urlencode({'uid': self.uid, 'secret': self.token}))
         webbrowser.open(url)
     
     def on_goto_add_btn_clicked(self, event):
+        import webbrowser
         url = self.pack_url(f"/task/add/?" + urlencode({'uid': self.uid, 'secret': self.token}))
         webbrowser.open(url)
 
-    def create_tomato(self, task: Task) -> int:
-        ''' Get tomato id
-        Returns:
-            {"is_ok": True, "tomato_id": tomato.id}
-        '''
-        url = self.pack_url('/tomato/create/')
-        params = {
-            'task_id': task.id
-        }
-        r = self.request("GET", url, params=params)
-        if not r:
-            return 0 
-        
-        data = r.json()
-        if data['is_ok'] is False:
-            self.set_error_tips(data['reason'])
-            return 0
-        
-        return data['tomato_id']
-    
-    def start_tomato(self, task: Task) -> dict:
-        '''
-        Returns:
-            {
-                "is_ok": True,
-                "start": tomato.start_datetime.strftime("%Y-%m-%d %H:%M:%S"),
-                "end": end.strftime("%Y-%m-%d %H:%M:%S"),
-                "left_seconds": left_seconds
-            }
-        '''
-        url = self.pack_url('/tomato/start/')
-        params = {
-            'tomato_id': task.opening_tomato_id
-        }
-        r = self.request('GET', url, params=params)
-        if not r:
-            return {}
-        data = r.json()
-        if data['is_ok'] is False:
-            self.set_error_tips(data['reason'])
-            return {}
-        
-        return data
-    
-    def abandon_tomato(self, task: Task) -> int:
-        ''' Abandon tomato
-        Returns:
-            int: abandon count
-        '''
-        url = self.pack_url('/tomato/abandon/')
-        params = {
-            'tomato_id': task.opening_tomato_id
-        }
-        r = self.request('GET', url, params=params)
-        if not r:
-            return 0
-        data = r.json()
-        if data['is_ok'] is False:
-            self.set_error_tips(data['reason'])
-            return 0
-        
-        return data['abandon_count']
-
-    def harvest_tomato(self, task: Task) -> dict:
-        '''Harvest tomato
-        Returns:
-            {
-                "is_ok": True,
-                "today_tomato_number": today_tomato_number,
-                "task_tomato_number": task.tomato_number,
-                "user_tomato_number": profile.left_tomato_number,
-                "experience": ExperienceValue.HARVEST_TOMATO,
-                "task_is_done": task.tomato_number >= task.expect_tomato_number,
-            }
-        '''
-        url = self.pack_url('/tomato/harvest/')
-        params = {
-            'tomato_id': task.opening_tomato_id
-        }
-        r = self.request('GET', url, params=params)
-        if not r:
-            return {}
-        data = r.json()
-        if data['is_ok'] is False:
-            self.set_error_tips(data['reason'])
-            return {}
-        
-        return data
-
-
-class MyTaskBarIcon(TaskBarIcon):
-
-    def __init__(self, frame: MainFrame):
-        super().__init__(iconType=TBI_DEFAULT_TYPE)
-        self.frame = frame
-
-        self.SetIcon(wx.Icon(settings.LOGO_PATH, wx.BITMAP_TYPE_ICON), settings.APP_NAME)
-
-        self.Bind(wx.EVT_MENU, self.OnTaskBarActivate, id=2)
-        self.Bind(wx.EVT_MENU, self.OnTaskBarDeactivate, id=3)
-        self.Bind(wx.EVT_MENU, self.OnTaskBarClose, id=4)
-
-    def CreatePopupMenu(self):
-        menu = wx.Menu(settings.APP_NAME)
-        idx = 1
-        opening_task = self.frame.get_opening_task()
-        if not opening_task:
-            menu.Append(idx, "等待开番中")           
-        else:
-            menu.Append(idx, f"{opening_task.title} {self.frame.format_seconds(opening_task.opening_tomato_left_seconds)}")   
-
-        menu.AppendSeparator()        
-
-        idx += 1
-        menu.Append(idx, '打开')
-
-        idx += 1
-        menu.Append(idx, '隐藏')
-
-        idx += 1
-        menu.Append(idx, '退出')
-
-        return menu
-
-    def OnTaskBarClose(self, event):
-        self.frame.Close()
-
-    def OnTaskBarActivate(self, event):
-        if not self.frame.IsShown():
-            self.frame.Show()
-            self.frame.Raise()
-
-    def OnTaskBarDeactivate(self, event):
-        if self.frame.IsShown():
-            self.frame.Hide()
-
-        
 
 if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        startup_profiler.enable(STARTED_AT)
+    if "--metrics" in sys.argv or settings.METRICS_ENABLED:
+        metrics.enable()
+    startup_profiler.mark("imports")
+    settings.init()
+    startup_profiler.mark("settings init")
     app = wx.App()
     main_frame = MainFrame(None, title="行恒", size=settings.APP_SIZE)
     app.MainLoop()
\ No newline at end of file
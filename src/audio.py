@@ -0,0 +1,100 @@
+from typing import Optional
+import logging
+import time
+
+import wx
+import wx.media
+
+
+logger = logging.getLogger(__name__)
+
+default_audio = None
+
+
+class Sound:
+
+    def __init__(self, ctrl: wx.media.MediaCtrl, path: str):
+        self.ctrl = ctrl
+        self.path = path
+        self.loaded = False
+        self.pending_play = False
+        self.load_started = 0.0
+        self.load_ms: Optional[float] = None
+        self.plays = 0
+        self.play_ms_total = 0.0
+
+
+class AudioService:
+    ''' One MediaCtrl per sound, loaded once and kept ready for the whole process
+
+    A play is only a seek and a start, and never waits: a sound still loading
+    plays as soon as its EVT_MEDIA_LOADED arrives. `metrics` reports the load
+    and play call latencies.
+    '''
+
+    def __init__(self, parent: wx.Window):
+        global default_audio
+        self.parent = parent
+        self.sounds: dict[str, Sound] = {}
+        default_audio = self
+
+    @classmethod
+    def get_default(cls) -> Optional["AudioService"]:
+        return default_audio
+
+    def preload(self, paths):
+        for path in paths:
+            self.load(str(path))
+
+    def load(self, path) -> Optional[Sound]:
+        sound = self.sounds.get(path)
+        if sound:
+            return sound
+
+        ctrl = wx.media.MediaCtrl(self.parent)
+        ctrl.Hide()
+        sound = Sound(ctrl, path)
+        ctrl.Bind(wx.media.EVT_MEDIA_LOADED, lambda event: self.on_loaded(sound))
+        sound.load_started = time.perf_counter()
+        if not ctrl.Load(path):
+            logger.warning(f"failed to load {path}")
+            ctrl.Destroy()
+            return None
+        self.sounds[path] = sound
+        return sound
+
+    def on_loaded(self, sound: Sound):
+        sound.loaded = True
+        sound.load_ms = round((time.perf_counter() - sound.load_started) * 1000, 2)
+        logger.info(f"loaded {sound.path} in {sound.load_ms}ms")
+        if sound.pending_play:
+            sound.pending_play = False
+            self.start(sound)
+
+    def play(self, path) -> bool:
+        ''' Returns False when the sound can not be loaded '''
+        sound = self.load(str(path))
+        if not sound:
+            return False
+        if sound.loaded:
+            self.start(sound)
+        else:
+            sound.pending_play = True
+        return True
+
+    def start(self, sound: Sound):
+        started = time.perf_counter()
+        sound.ctrl.Seek(0)
+        sound.ctrl.Play()
+        sound.plays += 1
+        sound.play_ms_total += (time.perf_counter() - started) * 1000
+
+    def metrics(self) -> dict:
+        return {
+            sound.path: {
+                "load_ms": sound.load_ms,
+                "plays": sound.plays,
+                "avg_play_ms": round(sound.play_ms_total / sound.plays, 3) if sound.plays else None,
+            }
+            for sound in self.sounds.values()
+        }
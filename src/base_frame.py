@@ -1,15 +1,40 @@
 import wx
-import requests
-import json
 import logging
-import os
-import traceback
+import math
 
-import settings
+from client import ApiClient
+from network import NetworkExecutor
+from scheduler import Handle, Scheduler
 
 
 logger = logging.getLogger(__name__)
 
+default_scheduler = None
+
+
+class SchedulerTimer(wx.Timer):
+    ''' The one wx.Timer of the process, armed for the nearest deadline of the scheduler '''
+
+    def __init__(self):
+        super().__init__()
+        self.scheduler = Scheduler(self.arm)
+
+    def arm(self, delay):
+        if delay is None:
+            self.Stop()
+            return
+        self.StartOnce(max(1, math.ceil(delay * 1000)))
+
+    def Notify(self):
+        self.scheduler.run_due()
+
+
+def get_scheduler() -> Scheduler:
+    global default_scheduler
+    if default_scheduler is None:
+        default_scheduler = SchedulerTimer().scheduler
+    return default_scheduler
+
 
 class BaseFrame(wx.Frame):
     BG_COLOR = (0x13, 0x1d, 0x27, 255)
@@ -17,61 +42,75 @@ class BaseFrame(wx.Frame):
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
 
-        self.token = ""
-        self.uid = -1
+        self.client = ApiClient.get_default()
         self.status_bar: wx.StatusBar = self.CreateStatusBar()
-        self.media_player = wx.media.MediaCtrl(self)
 
-        self.initial_token()
+    @property
+    def uid(self):
+        return self.client.uid
 
-    def initial_token(self):
-        if settings.TOKEN_PATH.exists():
-            data = json.loads(settings.TOKEN_PATH.read_text())
-            self.token = data['secret']
-            self.uid = data['uid']
+    @property
+    def token(self):
+        return self.client.token
 
     def set_error_tips(self, msg):
+        if not wx.IsMainThread():
+            wx.CallAfter(self.set_error_tips, msg)
+            return
+        if not self:
+            return
         if not msg:
             self.status_bar.SetStatusText('')
         else:
             self.status_bar.SetStatusText(f"错误：{msg}")
 
     def set_tips(self, msg):
+        if not wx.IsMainThread():
+            wx.CallAfter(self.set_tips, msg)
+            return
+        if not self:
+            return
         self.status_bar.SetStatusText(f"{msg}")
 
     def request(self, *args, **kwargs):
-        try:
-            if 'params' in kwargs:
-                kwargs['params'].update({
-                    'uid': self.uid,
-                    'secret': self.token,
-                    'app_version': settings.APP_VERSION,
-                    'app_build': settings.APP_BUILD,
-                    'app_platform': settings.APP_PLATFORM,
-                })
-            else:
-                kwargs['params'] = {
-                    'uid': self.uid,
-                    'secret': self.token,
-                    'app_version': settings.APP_VERSION,
-                    'app_build': settings.APP_BUILD,
-                    'app_platform': settings.APP_PLATFORM,
-                }
-
-            if 'SSL_CERT_FILE' in os.environ and os.environ['SSL_CERT_FILE']:
-                kwargs['cert'] = os.environ['SSL_CERT_FILE']
-                kwargs['verify'] = False
-            r = requests.request(*args, **kwargs)
-            logger.info(f"{r.url}, args {args}, kwargs {kwargs}, response {r.text}")
-        except Exception as e:
-            logger.warning(f"args {args}, kwargs {kwargs}, exception: {e}, {traceback.format_exc(10)}")
-            self.set_error_tips(e)
-            return None
-
-        return r
+        return self.client.request(*args, on_error=self.set_error_tips, **kwargs)
+
+    def run_in_background(self, fn, *args, callback=None, **kwargs):
+        ''' Run `fn` on the network executor and apply its result with `callback` on the ui thread.
+
+        The callback is skipped when the frame was destroyed in the meantime,
+        and receives None when `fn` raised.
+        '''
+        def apply(result):
+            if self and callback:
+                callback(result)
+
+        def deliver(result):
+            wx.CallAfter(apply, result)
+
+        def fail(exc):
+            self.set_error_tips(exc)
+            wx.CallAfter(apply, None)
+
+        return NetworkExecutor.get_default().submit(fn, *args, callback=deliver, errback=fail, **kwargs)
     
+    @property
+    def scheduler(self) -> Scheduler:
+        return get_scheduler()
+
+    def call_at(self, deadline, fn, *args) -> Handle:
+        ''' Schedule `fn` at a `time.monotonic()` deadline, skipped once the frame is destroyed '''
+        def run():
+            if self:
+                fn(*args)
+
+        return self.scheduler.call_at(deadline, run)
+
+    def call_later(self, delay, fn, *args) -> Handle:
+        return self.call_at(self.scheduler.clock() + delay, fn, *args)
+
     def pack_url(self, path):
-        return f"https://{settings.SERVER_HOST}{path}"
+        return self.client.pack_url(path)
     
     @classmethod
     def format_seconds(cls, seconds) -> str:
@@ -80,14 +119,10 @@ class BaseFrame(wx.Frame):
         return f"{minutes:02d}:{left:02d}"
             
     def is_logined(self):
-        if self.token:
-            return True
-        return False
+        return self.client.is_logined()
     
     def play_music(self, path):
-        # play mp3
-        if not self.media_player.Load(path):
+        from audio import AudioService
+        audio = AudioService.get_default() or AudioService(wx.GetApp().GetTopWindow() or self)
+        if not audio.play(path):
             self.set_error_tips(f"加载文件{path}失败")
-        else:
-            self.media_player.SetInitialSize()
-            self.media_player.Play()
\ No newline at end of file
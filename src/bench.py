@@ -0,0 +1,335 @@
+''' Benchmarks of the client against the local stub server, results as json
+
+Usage:
+    python bench.py --tasks 10 1000 100000 --output bench.json
+    xvfb-run python bench.py --tasks 1000 --latency 20 --failure-rate 0.01
+
+List refresh and paint need wx and a display (xvfb on a headless Linux box)
+and are reported as skipped without them. Results are compared with
+THRESHOLDS when the stub adds no latency and no failures, the exit code is 1
+when one of them is exceeded.
+'''
+from pathlib import Path
+from typing import Callable, Optional
+import argparse
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+
+import settings
+from client import ApiClient
+from credentials import Credentials
+from daemon import EventLoop
+from engine import Engine, EngineListener
+from metrics import metrics
+from models import Task
+from stub_server import StubState, make_task, serve
+from sync import TaskSync
+from task_index import NOT_STARTED, TaskIndex
+from task_store import TaskStore
+
+
+logger = logging.getLogger(__name__)
+
+# benchmark -> (base ms, extra ms per 1000 tasks), checked against the median
+THRESHOLDS = {
+    "sync_full": (200, 150),
+    "sync_not_modified": (50, 0),
+    "sync_delta": (100, 5),
+    "store_apply_full": (20, 20),
+    # one frame, typing in the filter box must not lag
+    "index_filter": (16, 0),
+    "index_update": (1, 0),
+    "list_refresh_full": (50, 30),
+    "list_refresh_one": (20, 1),
+    "paint_p90": (16, 0),
+    "start_to_lock_overhead": (150, 0),
+}
+
+
+class BenchClient(ApiClient):
+    ''' ApiClient of the stub, counting errors instead of showing them '''
+
+    def __init__(self, server_url, uid, token):
+        super().__init__(server_url, Credentials(uid=uid, token=token))
+        self.errors = 0
+        self.on_error = self.count_error
+
+    def count_error(self, msg):
+        self.errors += 1
+        logger.info(f"error {msg}")
+
+
+def measure(fn: Callable[[], object], repeat) -> dict:
+    ''' Milliseconds of `repeat` runs, a run returning None counts as failed '''
+    runs = []
+    failures = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        if fn() is None:
+            failures += 1
+            continue
+        runs.append((time.perf_counter() - started) * 1000)
+    return summary(runs, failures)
+
+
+def summary(runs, failures=0) -> dict:
+    if not runs:
+        return {"median_ms": None, "min_ms": None, "max_ms": None, "runs": 0, "failures": failures}
+    return {
+        "median_ms": round(statistics.median(runs), 3),
+        "min_ms": round(min(runs), 3),
+        "max_ms": round(max(runs), 3),
+        "runs": len(runs),
+        "failures": failures,
+    }
+
+
+def bench_sync(client: BenchClient, state: StubState, repeat) -> dict:
+    results = {}
+
+    sync = TaskSync(client)
+
+    def full():
+        sync.reset()
+        return sync.fetch()
+    results["sync_full"] = measure(full, repeat)
+
+    sync.fetch()
+    results["sync_not_modified"] = measure(sync.fetch, repeat)
+
+    def delta():
+        state.put_task(make_task(1))
+        return sync.fetch()
+    results["sync_delta"] = measure(delta, repeat)
+
+    # the list used by the store and list benchmarks
+    sync.reset()
+    results["tasks"] = sync.fetch()
+    sync.pool.shutdown()
+    return results
+
+
+def bench_store(tasks, repeat) -> dict:
+    def apply():
+        store = TaskStore()
+        return store.apply(tasks, full=True)
+    return {"store_apply_full": measure(apply, repeat)}
+
+
+def bench_index(tasks, repeat) -> dict:
+    ''' A filter by a common term and a bucket, and the index update of one retitled task '''
+    store = TaskStore()
+    index = TaskIndex(store)
+    store.apply(tasks, full=True)
+    results = {"index_filter": measure(lambda: index.filter("作业 1", progress=NOT_STARTED), repeat)}
+    if tasks:
+        titles = iter(range(repeat))
+        results["index_update"] = measure(lambda: store.update(tasks[0].id, title=f"作业 {next(titles)}"), repeat)
+    return results
+
+
+def bench_gui(tasks, repeat) -> dict:
+    ''' List refresh and paint, skipped without wx or a display '''
+    try:
+        import wx
+        from app import MainFrame
+        from canvas import Canvas
+        from task_list import TaskListCtrl, format_task_label
+    except ImportError as e:
+        return {"skipped": f"wx is not available: {e}"}
+
+    app = wx.App(False)
+    if not wx.Display.GetCount():
+        return {"skipped": "no display"}
+
+    results = {}
+    frame = wx.Frame(None, size=settings.APP_SIZE)
+    panel = wx.Panel(frame)
+    task_list = TaskListCtrl(panel, '作业列表')
+    canvas = Canvas(panel, 25 * 60, MainFrame.BG_COLOR, "🍅")
+    sizer = wx.BoxSizer(wx.VERTICAL)
+    sizer.Add(task_list, 1, wx.EXPAND)
+    sizer.Add(canvas, 1, wx.EXPAND)
+    panel.SetSizer(sizer)
+    frame.Show()
+    app.Yield()
+
+    def format_label(task):
+        # what MainFrame.format_task_label does, the stored seconds stand in for the engine's
+        if task.label is None:
+            task.label = format_task_label(task, task.opening_tomato_left_seconds)
+        return task.label
+
+    def refresh_full():
+        store = TaskStore()
+        store.apply(tasks, full=True)
+        task_list.model = type(task_list.model)()
+        return task_list.set_tasks(store, format_label)
+    results["list_refresh_full"] = measure(refresh_full, repeat)
+
+    store = TaskStore()
+    store.apply(tasks, full=True)
+    task_list.set_tasks(store, format_label)
+    if tasks:
+        task_id = tasks[0].id
+
+        def refresh_one():
+            changes = store.update(task_id, opening_tomato_id=1, opening_tomato_left_seconds=time.monotonic_ns() % 1500)
+            return task_list.apply_changes(changes, store, format_label)
+        results["list_refresh_one"] = measure(refresh_one, repeat)
+
+    metrics.enable()
+    for left_seconds in range(25 * 60, 25 * 60 - 60 * repeat, -1):
+        canvas.update(left_seconds, MainFrame.format_seconds(left_seconds))
+        canvas.Update()
+    paint = metrics.snapshot()["histograms"].get("paint")
+    results["paint_p90"] = {"median_ms": paint["p90"], "runs": paint["count"], "failures": 0} if paint else summary([])
+
+    frame.Destroy()
+    app.Yield()
+    return results
+
+
+class LockProbe(EngineListener):
+    ''' Notes when the engine locks '''
+
+    def __init__(self):
+        self.due_at: Optional[float] = None
+
+    def on_lock_due(self, task: Task):
+        self.due_at = time.perf_counter()
+
+
+def pump(loop: EventLoop, done: Callable[[], bool], timeout) -> bool:
+    ''' Run the engine loop until `done()`, False when `timeout` seconds passed first '''
+    deadline = time.monotonic() + timeout
+    while not done():
+        if time.monotonic() >= deadline:
+            return False
+        loop.run_once(timeout=0.01)
+    return True
+
+
+def bench_start_to_lock(client: BenchClient, state: StubState, task_id, repeat, tomato_seconds) -> dict:
+    ''' Click to lock through the Engine of the app, on the event loop of the headless mode
+
+    Each run is Engine.toggle_tomato, the journal write and its replay, the
+    lock moved to the server's end of the tomato, until on_lock_due. Reports
+    the time above the tomato length, that is request time and timer lateness.
+    The cache and the journal go to a temporary directory.
+    '''
+    state.tomato_seconds = tomato_seconds
+    overrides = {"PUSH_ENABLED": False}
+    saved = {name: getattr(settings, name) for name in ("PUSH_ENABLED", "CACHE_PATH", "JOURNAL_PATH")}
+    runs = []
+    failures = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        overrides["CACHE_PATH"] = Path(work_dir) / "cache.sqlite3"
+        overrides["JOURNAL_PATH"] = Path(work_dir) / "journal.jsonl"
+        for name, value in overrides.items():
+            setattr(settings, name, value)
+        loop = EventLoop()
+        engine = Engine(client, loop.scheduler, loop.post)
+        probe = LockProbe()
+        engine.subscribe(probe)
+        try:
+            engine.start()
+            idle = lambda: not len(engine.journal) and not engine.replaying and not engine.syncing
+            if not pump(loop, lambda: engine.find_task(task_id) and idle(), settings.HTTP_TIMEOUT * 4):
+                return {"start_to_lock_overhead": summary([], repeat)}
+
+            for _ in range(repeat):
+                probe.due_at = None
+                clicked = time.perf_counter()
+                engine.toggle_tomato(engine.find_task(task_id))
+                if pump(loop, lambda: probe.due_at is not None, tomato_seconds + settings.HTTP_TIMEOUT):
+                    runs.append((probe.due_at - clicked - tomato_seconds) * 1000)
+                else:
+                    failures += 1
+                # harvested, or abandoned when it never locked
+                engine.toggle_tomato(engine.find_task(task_id))
+                pump(loop, idle, settings.HTTP_TIMEOUT)
+        finally:
+            engine.close()
+            for name, value in saved.items():
+                setattr(settings, name, value)
+    return {"start_to_lock_overhead": summary(runs, failures)}
+
+
+def check(results: dict, task_count) -> list[str]:
+    ''' Names of the benchmarks above their threshold '''
+    exceeded = []
+    for name, (base, per_1k) in THRESHOLDS.items():
+        result = results.get(name)
+        if not result or result.get("median_ms") is None:
+            continue
+        limit = base + per_1k * task_count / 1000
+        result["threshold_ms"] = limit
+        if result["median_ms"] > limit:
+            exceeded.append(name)
+    return exceeded
+
+
+def run(task_counts, repeat, latency, failure_rate, tomato_seconds) -> dict:
+    report = {
+        "python": sys.version.split()[0],
+        "latency_ms": latency,
+        "failure_rate": failure_rate,
+        "repeat": repeat,
+        "runs": [],
+        "exceeded": [],
+    }
+    checked = not latency and not failure_rate
+    for task_count in task_counts:
+        state = StubState(task_count)
+        server = serve(state, latency=latency / 1000, failure_rate=failure_rate)
+        host, port = server.server_address[:2]
+        token = state.get_token("bench", "bench")
+        client = BenchClient(f"http://{host}:{port}", token['uid'], token['secret'])
+        try:
+            results = bench_sync(client, state, repeat)
+            tasks = results.pop("tasks")
+            if tasks is None:
+                results["skipped"] = "the initial sync failed"
+            else:
+                tasks = tasks.tasks
+                results.update(bench_store(tasks, repeat))
+                results.update(bench_index(tasks, repeat))
+                results.update(bench_gui(tasks, repeat))
+            if task_count:
+                results.update(bench_start_to_lock(client, state, task_count, repeat, tomato_seconds))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        results["request_errors"] = client.errors
+        exceeded = check(results, task_count) if checked else []
+        report["runs"].append({"tasks": task_count, "results": results})
+        report["exceeded"] += [f"{name}[{task_count}]" for name in exceeded]
+        logger.info(f"{task_count} tasks: {results}")
+    report["thresholds_checked"] = checked
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, nargs="+", default=[10, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds the stub adds to each response")
+    parser.add_argument("--failure-rate", type=float, default=0, help="share of stub responses that are 503")
+    parser.add_argument("--tomato-seconds", type=int, default=1)
+    parser.add_argument("--output", help="also write the json here")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run(args.tasks, args.repeat, args.latency, args.failure_rate, args.tomato_seconds)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    sys.exit(1 if report["exceeded"] else 0)
@@ -1,20 +1,26 @@
 import wx
 import math
 import random
+import time
 
 import logging
 
+from metrics import metrics
+
 
 logger = logging.getLogger(__name__)
 
 
 class Canvas(wx.Panel):
     DEFAULT_SECONDS = 25*60
+    MAX_FONT_SIZE = 200
+    MAX_CACHED_FONTS = 32
 
     def __init__(self, parent, seconds, color, title):
         super().__init__(parent)
         self.SetBackgroundStyle(wx.BG_STYLE_CUSTOM)
         self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_SIZE, self.OnSize)
 
         self.seconds = seconds
         if self.seconds <= 0:
@@ -23,6 +29,11 @@ class Canvas(wx.Panel):
         self.left_seconds = self.seconds
         self.title = title
 
+        self.pen = wx.Pen(self.color, width=2)
+        self.brush = wx.Brush(self.color)
+        # (title, width, height) -> (font, text width, text height)
+        self.fonts: dict[tuple, tuple] = {}
+
     def set_seconds(self, seconds):
         self.seconds = seconds
         if self.seconds <= 0:
@@ -30,44 +41,80 @@ class Canvas(wx.Panel):
         self.Refresh()
 
     def update(self, left_seconds, title=None):
+        ''' Invalidate only the band the progress moved over and the title '''
+        w, h = self.GetClientSize()
+        old_y = self.progress_y(h)
+        old_title = self.title
+
         self.left_seconds = left_seconds
         if title:
             self.title = title
+
+        new_y = self.progress_y(h)
+        top, bottom = min(old_y, new_y), max(old_y, new_y)
+        dirty = wx.Rect(0, int(top) - 1, w, int(bottom - top) + 3)
+        if self.title != old_title:
+            dirty = dirty.Union(self.title_rect(old_title, w, h))
+            dirty = dirty.Union(self.title_rect(self.title, w, h))
+        self.RefreshRect(dirty, eraseBackground=False)
+
+    def progress_y(self, h) -> float:
+        return h - h * (self.seconds - self.left_seconds) / self.seconds
+
+    def fit_title(self, title, w, h, dc=None) -> tuple:
+        ''' Largest bold font up to MAX_FONT_SIZE that keeps the title within 80% of the width '''
+        key = (title, w, h)
+        fitted = self.fonts.get(key)
+        if fitted:
+            return fitted
+
+        dc = dc or wx.ClientDC(self)
+        font_size = self.MAX_FONT_SIZE
+        while True:
+            font = wx.Font(int(font_size), wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD)
+            dc.SetFont(font)
+            text_width, text_height = dc.GetTextExtent(title)
+            if text_width <= w * 0.8 or font_size <= 1:
+                break
+            # jump close to the fitting size instead of shrinking 10% a time
+            font_size = max(1, min(0.9 * font_size, font_size * w * 0.8 / text_width))
+
+        if len(self.fonts) >= self.MAX_CACHED_FONTS:
+            self.fonts.clear()
+        self.fonts[key] = (font, text_width, text_height)
+        logger.debug(f"fit font size {font_size}, text ({text_width}, {text_height}), screen ({w}, {h})")
+        return self.fonts[key]
+
+    def title_rect(self, title, w, h, dc=None) -> wx.Rect:
+        _, text_width, text_height = self.fit_title(title, w, h, dc)
+        return wx.Rect(int(w / 2 - text_width / 2) - 1, int(h / 2 - text_height / 2) - 1, int(text_width) + 2, int(text_height) + 2)
+
+    def OnSize(self, evt):
         self.Refresh()
+        evt.Skip()
 
     def OnPaint(self, evt):
+        started = time.perf_counter() if metrics.enabled else 0
         w, h = self.GetClientSize()
         dc = wx.AutoBufferedPaintDC(self)
+        box: wx.Rect = self.GetUpdateRegion().GetBox()
+        dc.SetClippingRegion(box)
         dc.Clear()
 
-        gc: wx.GraphicsContext = dc.GetGraphicsContext()
+        gc: wx.GraphicsContext = dc.GetGraphicsContext() or wx.GraphicsContext.Create(dc)
+        gc.Clip(box.x, box.y, box.width, box.height)
 
-        #gc.SetBrush(wx.Brush(wx.WHITE))
-        #gc.DrawRectangle(0, 0, w, h)
+        gc.SetPen(self.pen)
+        gc.SetBrush(self.brush)
 
-        gc.SetPen(wx.Pen(self.color, width=2))
-        gc.SetBrush(wx.Brush(self.color))
+        y = self.progress_y(h)
+        gc.DrawRectangle(0, y, w, h - y)
 
-        logger.info(f"left seconds {self.left_seconds}, seconds {self.seconds}")
-        rect_height = h * (self.seconds - self.left_seconds) / self.seconds
-        y = h - rect_height
-        gc.DrawRectangle(0, y, w, rect_height)
-        
         # write text
-        font_size = 200
-        while True:
-            font = wx.Font(int(font_size), wx.FONTFAMILY_DEFAULT, wx.FONTSTYLE_NORMAL, wx.FONTWEIGHT_BOLD)
-            gc.SetFont(font, wx.WHITE)
-            text_width, text_height = dc.GetTextExtent(self.title)
-            if text_width > w *0.8:
-                font_size = 0.9 * font_size
-            else:
-                break
-        
+        font, text_width, text_height = self.fit_title(self.title, w, h, dc)
         gc.SetFont(font, wx.WHITE)
-        gc.SetPen(wx.Pen(wx.WHITE, width=2))
-        text_width, text_height = dc.GetTextExtent(self.title)
-        logger.info(f"final font size {font_size}, text ({text_width}, {text_height}), screen ({w}, {h})")
         title_y = h / 2 - text_height / 2
         title_x = w / 2  - text_width / 2
         gc.DrawText(self.title, title_x, title_y)
+        if started:
+            metrics.record_ms("paint", started)
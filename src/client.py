@@ -0,0 +1,200 @@
+from typing import Callable, Optional
+from urllib.parse import urlsplit
+import logging
+import threading
+import time
+import traceback
+
+import settings
+from credentials import Credentials
+from metrics import metrics
+from models import User, parse_users
+from network import decode_json, get_session, http_ok
+from read_cache import ReadCache
+
+
+logger = logging.getLogger(__name__)
+
+default_client = None
+default_client_lock = threading.Lock()
+
+
+class ApiClient:
+    ''' Credentials and calls of the 51zhi.com api, without any gui
+
+    Every method may run on a worker thread. Failures are handed to `on_error`,
+    which the gui points at a status bar and which only logs by default.
+    '''
+
+    def __init__(self, server_url=None, credentials: Optional[Credentials] = None):
+        # scheme://host, settings.SERVER_* when None
+        self.server_url = server_url
+        self.credentials = credentials or Credentials.get_default()
+        self.reads = ReadCache()
+        self.on_error: Callable[[object], None] = lambda msg: logger.info(f"error {msg}")
+
+    @classmethod
+    def get_default(cls) -> "ApiClient":
+        global default_client
+        with default_client_lock:
+            if default_client is None:
+                default_client = cls()
+            return default_client
+
+    @property
+    def uid(self):
+        return self.credentials.uid
+
+    @property
+    def token(self):
+        return self.credentials.token
+
+    def save_token(self, data: dict):
+        self.credentials.save(data)
+        self.reads.invalidate()
+
+    def is_logined(self) -> bool:
+        return bool(self.token)
+
+    def report_error(self, msg, on_error=None):
+        (on_error or self.on_error)(msg)
+
+    def pack_url(self, path):
+        if self.server_url:
+            return f"{self.server_url}{path}"
+        return f"{settings.SERVER_SCHEME}://{settings.SERVER_HOST}{path}"
+
+    def request(self, *args, on_error=None, **kwargs):
+        ''' Returns the response, None when the server could not be reached '''
+        try:
+            params = kwargs.get('params')
+            auth_params = self.credentials.params()
+            kwargs['params'] = {**params, **auth_params} if params else auth_params
+
+            kwargs.setdefault('timeout', settings.HTTP_TIMEOUT)
+            started = time.perf_counter()
+            r = get_session().request(*args, **kwargs)
+            if metrics.enabled:
+                path = urlsplit(str(r.url)).path
+                metrics.record_ms(f"request {path}", started)
+                metrics.record_bytes(f"response bytes {path}", len(r.content))
+            # the secret is masked by the log listener, the body is only decoded for DEBUG
+            logger.info(f"{r.url}, args {args}, status {r.status_code}, {len(r.content)} bytes")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{r.url} response {r.text}")
+        except Exception as e:
+            logger.warning(f"args {args}, kwargs {kwargs}, exception: {e}, {traceback.format_exc(10)}")
+            self.report_error(e, on_error)
+            return None
+
+        return r
+
+    def get_token(self, username, password, on_error=None) -> Optional[dict]:
+        url = self.pack_url('/account/mobile/get_token/')
+        r = self.request('GET', url, params={'username': username, 'password': password}, on_error=on_error)
+        if not http_ok(r):
+            if r is not None:
+                logger.warning(f"get {url} failed: status code {r.status_code}, response {r.text}")
+                self.report_error(r.text, on_error)
+            return None
+
+        data = decode_json(r)
+        if data['is_ok'] is False:
+            logger.warning(f"failed to login: {data}")
+            self.report_error(f'登陆失败, {data["reason"]}', on_error)
+            return None
+
+        return data
+
+    def get_user_info(self, on_error=None) -> Optional[User]:
+        ''' Cached for USER_INFO_TTL_SECONDS, concurrent callers share one request
+
+        Only the `on_error` of the caller that sent it hears of a failure.
+        '''
+        return self.reads.get(('user_info', self.uid), lambda: self.fetch_user_info(on_error), settings.USER_INFO_TTL_SECONDS)
+
+    def fetch_user_info(self, on_error=None) -> Optional[User]:
+        r = self.request("GET", self.pack_url("/mobile/user/info/"), params={'user_id': self.uid}, on_error=on_error)
+        if not http_ok(r):
+            return None
+
+        data = decode_json(r)
+        if data['is_ok'] is False:
+            self.report_error(data['reason'], on_error)
+            return None
+
+        return parse_users.one(dict(data['user'], today_tomato_count=data.get('today_tomato_count')))
+
+    def tomato_api(self, path, params, idempotency_key) -> Optional[dict]:
+        '''
+        Returns:
+            the response data, None when the server could not be reached,
+            {"is_ok": False, "retry": True, ...} when it failed with a 5xx or
+            the answer is not one of the api, like the error page of a proxy
+        '''
+        params['idempotency_key'] = idempotency_key
+        r = self.request('GET', self.pack_url(path), params=params)
+        if r is None:
+            return None
+        if r.status_code >= 500:
+            return {'is_ok': False, 'retry': True, 'reason': f"status code {r.status_code}"}
+        try:
+            data = decode_json(r)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'is_ok' not in data:
+            return {'is_ok': False, 'retry': True, 'reason': f"status code {r.status_code}, no api response"}
+        if not data.get('is_ok'):
+            self.report_error(data.get('reason', f"status code {r.status_code}"))
+        return data
+
+    def create_tomato(self, task_id, idempotency_key, start=False) -> Optional[dict]:
+        ''' Get tomato id
+        Args:
+            start: ask to start it as well, a server without the support ignores it
+        Returns:
+            {"is_ok": True, "tomato_id": tomato.id}, plus the fields of start_tomato when it was started
+        '''
+        params = {'task_id': task_id}
+        if start:
+            params['start'] = 1
+        return self.tomato_api('/tomato/create/', params, idempotency_key)
+
+    def start_tomato(self, tomato_id, idempotency_key) -> Optional[dict]:
+        '''
+        Returns:
+            {
+                "is_ok": True,
+                "start": tomato.start_datetime.strftime("%Y-%m-%d %H:%M:%S"),
+                "end": end.strftime("%Y-%m-%d %H:%M:%S"),
+                "left_seconds": left_seconds
+            }
+        '''
+        return self.tomato_api('/tomato/start/', {'tomato_id': tomato_id}, idempotency_key)
+
+    def abandon_tomato(self, tomato_id, idempotency_key) -> Optional[dict]:
+        ''' Abandon tomato
+        Returns:
+            {"is_ok": True, "abandon_count": abandon_count}
+        '''
+        return self.counted(self.tomato_api('/tomato/abandon/', {'tomato_id': tomato_id}, idempotency_key))
+
+    def harvest_tomato(self, tomato_id, idempotency_key) -> Optional[dict]:
+        '''Harvest tomato
+        Returns:
+            {
+                "is_ok": True,
+                "today_tomato_number": today_tomato_number,
+                "task_tomato_number": task.tomato_number,
+                "user_tomato_number": profile.left_tomato_number,
+                "experience": ExperienceValue.HARVEST_TOMATO,
+                "task_is_done": task.tomato_number >= task.expect_tomato_number,
+            }
+        '''
+        return self.counted(self.tomato_api('/tomato/harvest/', {'tomato_id': tomato_id}, idempotency_key))
+
+    def counted(self, data: Optional[dict]) -> Optional[dict]:
+        ''' The tomato counters of the user changed, when `data` tells the action succeeded '''
+        if data and data.get('is_ok'):
+            self.reads.invalidate(('user_info', self.uid))
+        return data
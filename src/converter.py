@@ -0,0 +1,90 @@
+from dataclasses import MISSING, fields
+from typing import Generic, Iterable, Optional, TypeVar
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+COERCIBLE = (int, str, bool, float)
+
+
+class Converter(Generic[T]):
+    ''' Bulk dict -> dataclass conversion through generated code
+
+    The loop over the items is generated once per dataclass with every field
+    unrolled, so converting costs one dict lookup per field and no
+    `**kwargs` or `fields()` walk per item. Unknown keys are ignored, missing
+    or null ones take the default, values of the wrong type are coerced to the
+    annotated int/str/bool/float, and an item missing a `required` key or
+    failing coercion is skipped and counted in `invalid`.
+
+    >>> from models import Task
+    >>> convert = Converter(Task, required=('id',))
+    >>> [(x.id, x.title, x.tomato_number) for x in convert([{"id": "7", "title": "a", "tomato_number": None, "x": 1}, {"title": "no id"}])]
+    [(7, 'a', 0)]
+    >>> convert.invalid
+    1
+    '''
+
+    def __init__(self, cls: type[T], required: Iterable[str] = ()):
+        self.cls = cls
+        self.required = tuple(required)
+        # derived fields (init=False) are neither read nor dumped
+        self.fields = [x for x in fields(cls) if x.init]
+        self.names = [x.name for x in self.fields]
+        self.invalid = 0
+        self.convert = self.generate()
+
+    def generate(self):
+        namespace = {"cls": self.cls}
+        lines = [
+            "def convert(items, skip):",
+            "    result = []",
+            "    append = result.append",
+            "    for item in items:",
+            "        try:",
+            "            get = item.get",
+        ]
+        names = []
+        for i, f in enumerate(self.fields):
+            name = f"v{i}"
+            names.append(name)
+            if f.name in self.required:
+                lines.append(f"            {name} = item[{f.name!r}]")
+            elif f.default is not MISSING:
+                namespace[f"d{i}"] = f.default
+                lines.append(f"            {name} = get({f.name!r})")
+                lines.append(f"            if {name} is None: {name} = d{i}")
+            else:
+                # a fresh mutable default per item
+                namespace[f"d{i}"] = f.default_factory
+                lines.append(f"            {name} = get({f.name!r})")
+                lines.append(f"            if {name} is None: {name} = d{i}()")
+            kind = f.type if isinstance(f.type, type) else None
+            if kind in COERCIBLE:
+                namespace[f"t{i}"] = kind
+                lines.append(f"            if {name}.__class__ is not t{i}: {name} = t{i}({name})")
+        lines += [
+            f"            append(cls({', '.join(names)}))",
+            "        except (KeyError, TypeError, ValueError, AttributeError) as e:",
+            "            skip(item, e)",
+            "    return result",
+        ]
+        exec("\n".join(lines), namespace)
+        return namespace["convert"]
+
+    def skip(self, item, e):
+        self.invalid += 1
+        logger.warning(f"skip invalid {self.cls.__name__} {item!r}: {e!r}")
+
+    def __call__(self, items: Iterable[dict]) -> list[T]:
+        return self.convert(items, self.skip)
+
+    def dump(self, obj: T) -> dict:
+        return {name: getattr(obj, name) for name in self.names}
+
+    def one(self, item: dict) -> Optional[T]:
+        result = self.convert((item,), self.skip)
+        return result[0] if result else None
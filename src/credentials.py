@@ -0,0 +1,97 @@
+from pathlib import Path
+from typing import Optional
+import json
+import logging
+import os
+import threading
+import time
+
+import settings
+
+
+logger = logging.getLogger(__name__)
+
+default_credentials = None
+default_credentials_lock = threading.Lock()
+
+
+class Credentials:
+    ''' The login token of the process, read from `path` once
+
+    `params()` hands out the auth and version query parameters of every
+    request, built once per token. The file is only stat'ed again every
+    TOKEN_CHECK_SECONDS, to pick up a login of another process. A `path` of
+    None keeps the token in memory only.
+    '''
+
+    def __init__(self, path: Optional[Path] = None, uid=-1, token=""):
+        self.path = path
+        self.lock = threading.Lock()
+        self.uid = uid
+        self.token = token
+        self.mtime_ns = None
+        self.checked = 0.0
+        self.auth_params = self.build_params()
+        if path is not None:
+            self.load()
+
+    @classmethod
+    def get_default(cls) -> "Credentials":
+        global default_credentials
+        with default_credentials_lock:
+            if default_credentials is None:
+                default_credentials = cls(settings.TOKEN_PATH)
+            return default_credentials
+
+    def build_params(self) -> dict:
+        # never mutated, a new token gets a new dict
+        return {
+            'uid': self.uid,
+            'secret': self.token,
+            'app_version': settings.APP_VERSION,
+            'app_build': settings.APP_BUILD,
+            'app_platform': settings.APP_PLATFORM,
+        }
+
+    def load(self):
+        with self.lock:
+            self.checked = time.monotonic()
+            try:
+                mtime_ns = self.path.stat().st_mtime_ns
+            except FileNotFoundError:
+                return
+            if mtime_ns == self.mtime_ns:
+                return
+            try:
+                data = json.loads(self.path.read_text())
+            except ValueError as e:
+                logger.warning(f"broken token file {self.path}: {e}")
+                return
+            self.mtime_ns = mtime_ns
+            self.set(data)
+            logger.info(f"loaded the token of uid {self.uid}")
+
+    def set(self, data: dict):
+        self.uid = data['uid']
+        self.token = data['secret']
+        self.auth_params = self.build_params()
+
+    def save(self, data: dict):
+        ''' Write through a temporary file, a crash never leaves half a token behind '''
+        with self.lock:
+            if self.path is not None:
+                tmp = self.path.with_suffix(".tmp")
+                with tmp.open("w") as f:
+                    f.write(json.dumps(data))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                self.mtime_ns = self.path.stat().st_mtime_ns
+                self.checked = time.monotonic()
+            self.set(data)
+
+    def params(self) -> dict:
+        ''' The auth query parameters, shared: do not modify '''
+        if self.path is not None and time.monotonic() - self.checked >= settings.TOKEN_CHECK_SECONDS:
+            self.load()
+        return self.auth_params
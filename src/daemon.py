@@ -0,0 +1,138 @@
+''' Headless mode without wx or a tray icon
+
+Keeps the tasks in sync, counts the opening tomato down and reminds on stdout
+and in the log when to rest and when the rest is over. Log in once with the
+gui, the token in WORK_DIR is shared.
+
+Usage:
+    python daemon.py
+'''
+from typing import Optional
+import logging
+import queue
+import signal
+import sys
+
+import settings
+from client import ApiClient
+from engine import Engine, EngineListener, rest_seconds
+from models import Task, User
+from scheduler import Scheduler
+
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoop:
+    ''' The engine thread of the daemon: jobs posted from any thread, plus the scheduler deadlines '''
+
+    def __init__(self):
+        self.jobs = queue.SimpleQueue()
+        self.scheduler = Scheduler(self.arm)
+        self.deadline: Optional[float] = None
+        self.running = False
+
+    def arm(self, delay):
+        self.deadline = None if delay is None else self.scheduler.clock() + delay
+
+    def post(self, fn, *args):
+        ''' Thread safe, the engine's `dispatch` '''
+        self.jobs.put((fn, args))
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def run_once(self, timeout=None):
+        ''' Run the due deadlines or the next job, waiting at most `timeout` seconds for one '''
+        if self.deadline is not None:
+            wait = self.deadline - self.scheduler.clock()
+            if wait <= 0:
+                self.deadline = None
+                self.scheduler.run_due()
+                return
+            timeout = wait if timeout is None else min(timeout, wait)
+        try:
+            fn, args = self.jobs.get(timeout=timeout)
+        except queue.Empty:
+            return
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception(f"job {fn} failed")
+
+    def stop(self):
+        self.post(setattr, self, 'running', False)
+
+
+class Reminder(EngineListener):
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.rest_handle = None
+        # fetched ahead by on_lock_prepare
+        self.user: Optional[User] = None
+
+    def say(self, msg):
+        logger.info(msg)
+        print(msg, flush=True)
+
+    def on_lock_armed(self, task: Task):
+        left_seconds = self.engine.lock_left_seconds()
+        self.say(f"{task.title} 开番中，{left_seconds // 60:02d}:{left_seconds % 60:02d} 后休息")
+
+    def on_lock_prepare(self, task: Task, user: Optional[User]):
+        self.user = user
+
+    def on_lock_cancelled(self):
+        self.user = None
+
+    def on_lock_stopped(self):
+        logger.info("no tomato is counted down")
+
+    def on_lock_due(self, task: Task):
+        self.say(f"{task.title} 的番茄完成了，离开电脑，走动走动")
+        user, self.user = self.user, None
+        if user:
+            self.on_user_info(task, user)
+        else:
+            self.engine.run_in_background(self.engine.client.get_user_info, callback=lambda user: self.on_user_info(task, user))
+
+    def on_user_info(self, task: Task, user: Optional[User]):
+        seconds = rest_seconds(user)
+        if user:
+            self.say(f"今日已经成功完成了{user.today_tomato_count}🍂，休息 {seconds // 60} 分钟")
+        self.engine.scheduler.cancel(self.rest_handle)
+        self.rest_handle = self.engine.call_later(seconds, self.on_rest_done, task)
+
+    def on_rest_done(self, task: Task):
+        self.rest_handle = None
+        self.say("休息结束")
+
+    def on_tips(self, msg):
+        self.say(msg)
+
+
+def main() -> int:
+    settings.init()
+    client = ApiClient.get_default()
+    if not client.is_logined():
+        print(f"no token in {settings.TOKEN_PATH}, log in with the gui first", file=sys.stderr)
+        return 1
+
+    loop = EventLoop()
+    engine = Engine(client, loop.scheduler, loop.post)
+    engine.subscribe(Reminder(engine))
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: loop.stop())
+
+    loop.post(engine.start)
+    loop.run()
+    engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
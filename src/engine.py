@@ -0,0 +1,584 @@
+from typing import Callable, Optional
+import datetime
+import logging
+import math
+import time
+
+import settings
+from client import ApiClient
+from journal import Journal
+from metrics import COUNT_BOUNDS, metrics
+from models import Task, User
+from network import NetworkExecutor
+from push import PushChannel
+from scheduler import Handle, Scheduler
+from sync import SyncResult, TaskSync
+from task_cache import TaskCache
+from task_store import TaskChanges, TaskStore
+from tomato import InvalidTransition, TomatoState, task_state, transition
+
+
+logger = logging.getLogger(__name__)
+
+
+def rest_seconds(user: Optional[User]) -> int:
+    ''' Every LONG_REST_EVERY-th tomato of the day earns the long rest
+
+    >>> rest_seconds(User(today_tomato_count=8)), rest_seconds(User(today_tomato_count=3)), rest_seconds(None)
+    (1800, 300, 300)
+    '''
+    if user and user.today_tomato_count % settings.LONG_REST_EVERY == 0:
+        return settings.LONG_REST_SECONDS
+    return settings.REST_SECONDS
+
+
+class EngineListener:
+    ''' What a view of the engine is told, every hook runs on the engine thread '''
+
+    def on_lock_armed(self, task: Task):
+        ''' The opening tomato of `task` is counted down '''
+
+    def on_lock_prepare(self, task: Task, user: Optional[User]):
+        ''' The tomato of `task` ends in LOCK_PREPARE_SECONDS, `user` is None when it could not be fetched '''
+
+    def on_lock_due(self, task: Task):
+        ''' The tomato of `task` is over, time to rest '''
+
+    def on_lock_cancelled(self):
+        ''' The tomato ended early, abandoned or finished elsewhere, and will not be due '''
+
+    def on_lock_stopped(self):
+        ''' No tomato is counted down any more '''
+
+    def on_synced(self, result: Optional[SyncResult]):
+        ''' A sync finished, None when it failed '''
+
+    def on_tips(self, msg):
+        pass
+
+
+class Engine:
+    ''' Tasks, sync, the tomato lifecycle and lock timing, without any gui
+
+    Owns the task store, its sqlite cache, the action journal and the lock
+    deadline. All state lives on one thread: blocking calls run on the network
+    executor and their results come back through `dispatch` (wx.CallAfter in
+    the gui, the loop of daemon.py headless), timers through `scheduler`.
+    Views subscribe an EngineListener and read `task_store`.
+    '''
+
+    def __init__(self, client: ApiClient, scheduler: Scheduler, dispatch: Callable):
+        self.client = client
+        self.scheduler = scheduler
+        self.dispatch = dispatch
+        self.listeners: list[EngineListener] = []
+        self.closed = False
+
+        self.lock_listen_task_id = 0
+        self.lock_start_time = None
+        # time.monotonic() deadline of the opening tomato
+        self.lock_deadline = None
+        self.lock_handle = None
+        self.lock_prepare_handle = None
+
+        self.last_sync_task_time = None
+        self.syncing = False
+        self.sync_started = 0.0
+        self.sync_handle = None
+        self.sync_again = False
+        self.sync_again_while_locked = False
+        # hidden to the tray or iconized: slower sync
+        self.background = False
+        self.push: Optional[PushChannel] = None
+
+        self.task_store = TaskStore()
+        self.task_sync = TaskSync(client)
+
+        self.task_cache = TaskCache(settings.CACHE_PATH)
+        self.cache_flush_handle = None
+        self.journal = Journal(settings.JOURNAL_PATH, settings.JOURNAL_MAX_AGE_SECONDS)
+        self.replaying = False
+        self.replay_handle = None
+        # task id -> state, for the CREATED tomatoes the task fields can not tell
+        self.tomato_states: dict[int, TomatoState] = {}
+        # local tomato id -> response of a create that started it too, see send_journal_entry
+        self.started_tomatoes: dict[int, dict] = {}
+
+    def subscribe(self, listener: EngineListener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: EngineListener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, name, *args):
+        for listener in list(self.listeners):
+            getattr(listener, name)(*args)
+
+    def start(self):
+        ''' Show the cache, then catch up with the server '''
+        self.load_cache()
+        self.replay_journal()
+        self.sync_tasks()
+        self.initial_lock_timer()
+        if settings.PUSH_ENABLED:
+            self.push = PushChannel(
+                self.client,
+                on_change=lambda: self.dispatch(self.on_push_change),
+                on_state=lambda connected: self.dispatch(self.schedule_sync),
+            )
+            self.push.start()
+
+    def close(self):
+        self.closed = True
+        if self.push:
+            self.push.stop()
+        for handle in (self.lock_handle, self.lock_prepare_handle, self.sync_handle, self.cache_flush_handle, self.replay_handle):
+            self.scheduler.cancel(handle)
+        self.task_sync.cancel()
+        self.task_cache.close()
+
+    def run_in_background(self, fn, *args, callback=None, **kwargs):
+        ''' Run `fn` on the network executor, `callback` gets its result (None when it raised) on the engine thread '''
+        def apply(result):
+            if not self.closed and callback:
+                callback(result)
+
+        def fail(exc):
+            self.client.report_error(exc)
+            self.dispatch(apply, None)
+
+        return NetworkExecutor.get_default().submit(fn, *args, callback=lambda result: self.dispatch(apply, result), errback=fail, **kwargs)
+
+    def call_at(self, deadline, fn, *args) -> Handle:
+        def run():
+            if not self.closed:
+                fn(*args)
+
+        return self.scheduler.call_at(deadline, run)
+
+    def call_later(self, delay, fn, *args) -> Handle:
+        return self.call_at(self.scheduler.clock() + delay, fn, *args)
+
+    def load_cache(self):
+        ''' The last known tasks right away, the sync reconciles them in background '''
+        snapshot = self.task_cache.load(self.client.uid)
+        tomato = snapshot.meta.get('tomato')
+        for task in snapshot.tasks:
+            if tomato and task.id == tomato['task_id'] and task.opening_tomato_id == tomato['tomato_id']:
+                task.opening_tomato_left_seconds = max(0, int(tomato['end'] - time.time()))
+            else:
+                # stale without the absolute end time
+                task.opening_tomato_left_seconds = 0
+
+        self.task_sync.restore(snapshot.meta.get('watermark', ''), snapshot.meta.get('etag'), snapshot.meta.get('last_modified'))
+        self.task_store.apply(snapshot.tasks, full=True)
+        self.task_store.subscribe(self.on_tasks_cached)
+        logger.info(f"loaded {len(snapshot.tasks)} cached tasks")
+
+    def on_tasks_cached(self, changes: TaskChanges):
+        self.task_cache.mark_changes(changes, self.task_store)
+        self.schedule_cache_flush()
+
+    def schedule_cache_flush(self):
+        if self.cache_flush_handle:
+            return
+        self.cache_flush_handle = self.call_later(settings.CACHE_FLUSH_SECONDS, self.flush_cache)
+
+    def flush_cache(self):
+        self.cache_flush_handle = None
+        if self.task_cache.is_dirty():
+            self.task_cache.flush()
+
+    def set_background(self, background):
+        if background == self.background:
+            return
+        self.background = background
+        if background or not self.sync_tasks():
+            self.schedule_sync()
+
+    def find_task(self, task_id) -> Optional[Task]:
+        return self.task_store.get(task_id)
+
+    def get_opening_task(self) -> Optional[Task]:
+        return self.task_store.opening_task()
+
+    def opening_left_seconds(self, task: Task) -> int:
+        ''' Up to date even when the stored seconds are not refreshed '''
+        if task.id == self.lock_listen_task_id:
+            return self.lock_left_seconds()
+        return task.opening_tomato_left_seconds
+
+    def lock_left_seconds(self) -> int:
+        if self.lock_deadline is None:
+            return 0
+        return max(0, math.ceil(self.lock_deadline - self.scheduler.clock()))
+
+    def initial_lock_timer(self):
+        if self.lock_listen_task_id > 0:
+            return
+        opening_task = self.get_opening_task()
+        if not opening_task:
+            return
+
+        if opening_task.opening_tomato_left_seconds <= 1:
+            return
+
+        self.lock_listen_task_id = opening_task.id
+        wait_seconds = int(opening_task.opening_tomato_left_seconds)
+        logger.info(f"wait seconds {wait_seconds}")
+        self.arm_lock(opening_task, wait_seconds)
+
+    def arm_lock(self, task: Task, wait_seconds):
+        for handle in (self.lock_handle, self.lock_prepare_handle):
+            self.scheduler.cancel(handle)
+        self.lock_deadline = self.scheduler.clock() + wait_seconds
+        self.lock_start_time = datetime.datetime.now() + datetime.timedelta(seconds=wait_seconds)
+        self.lock_handle = self.call_at(self.lock_deadline, self.start_lock)
+        self.lock_prepare_handle = self.call_at(self.lock_deadline - settings.LOCK_PREPARE_SECONDS, self.prepare_lock)
+        self.notify('on_lock_armed', task)
+
+        self.save_tomato_end(task)
+
+    def prepare_lock(self):
+        ''' Fetch the user for the rest length ahead, so the lock only has to be shown when it is due '''
+        self.lock_prepare_handle = None
+        task_id = self.lock_listen_task_id
+        deadline = self.lock_deadline
+        self.run_in_background(self.client.get_user_info, callback=lambda user: self.on_lock_prepared(task_id, deadline, user))
+
+    def on_lock_prepared(self, task_id, deadline, user: Optional[User]):
+        task = self.find_task(task_id)
+        if not task or task_id != self.lock_listen_task_id or deadline != self.lock_deadline:
+            # due, stopped or moved meanwhile
+            return
+        self.notify('on_lock_prepare', task, user)
+
+    def save_tomato_end(self, task: Task):
+        self.task_cache.set_meta('tomato', {
+            'task_id': task.id,
+            'tomato_id': task.opening_tomato_id,
+            'end': time.time() + (self.lock_deadline - self.scheduler.clock()),
+        })
+        self.task_cache.flush()
+
+    def stop_lock_listen(self, due=False):
+        for handle in (self.lock_handle, self.lock_prepare_handle):
+            self.scheduler.cancel(handle)
+        self.lock_handle = self.lock_prepare_handle = None
+        self.lock_listen_task_id = 0
+        self.lock_start_time = None
+        self.lock_deadline = None
+        self.task_cache.set_meta('tomato', None)
+        self.schedule_cache_flush()
+        if not due:
+            self.notify('on_lock_cancelled')
+        self.notify('on_lock_stopped')
+
+    def adjust_lock(self, task: Task, left_seconds):
+        ''' Move the deadline armed by the optimistic start to the server's end of the tomato '''
+        if self.lock_listen_task_id != task.id or abs(self.lock_left_seconds() - left_seconds) <= 1:
+            return
+        logger.info(f"adjust the lock of task {task.id} to {left_seconds} seconds")
+        self.task_store.update(task.id, opening_tomato_left_seconds=left_seconds)
+        self.arm_lock(task, left_seconds)
+
+    def start_lock(self):
+        task = self.find_task(self.lock_listen_task_id)
+        self.stop_lock_listen(due=True)
+        if task:
+            if self.tomato_state(task) is TomatoState.RUNNING:
+                self.advance_tomato(task, 'ripen', opening_tomato_left_seconds=0)
+            self.notify('on_lock_due', task)
+
+    def sync_tasks(self, sync_interval_seconds=settings.SYNC_INTERVAL_SECONDS, while_locked=False) -> bool:
+        ''' Schedule a background fetch of the task list.
+
+        Forced syncs (interval 0) while one is running are coalesced into one
+        more sync after it. Pages are merged by `on_tasks_page` as they
+        arrive, the final result by `on_tasks_synced`.
+        No sync runs while a tomato is counted down, unless `while_locked`.
+        Returns True when a fetch was scheduled.
+        '''
+        if self.syncing:
+            if sync_interval_seconds > 0:
+                logger.info("sync is running, abort")
+                return False
+            # may have started before what forced this one, fetch again once it finished
+            logger.info("sync is running, sync again after it")
+            self.sync_again = True
+            self.sync_again_while_locked |= while_locked
+            return True
+
+        if self.last_sync_task_time:
+            interval = datetime.datetime.now() - self.last_sync_task_time
+            if interval.total_seconds() <= sync_interval_seconds:
+                logger.info(f"interval {interval.total_seconds()} seconds is less than {sync_interval_seconds}, abort")
+                return False
+
+        if self.lock_listen_task_id > 0 and not while_locked:
+            logger.info(f"lock listen task id {self.lock_listen_task_id} is exists, abort")
+            return False
+
+        if len(self.journal):
+            # the server does not know the journaled actions yet
+            logger.info(f"{len(self.journal)} journal entries are pending, abort")
+            if sync_interval_seconds <= 0:
+                # forced, run it once the replay drained the journal
+                self.sync_again = True
+                self.sync_again_while_locked |= while_locked
+            return False
+
+        generation = self.task_sync.cancel()
+        self.syncing = True
+        self.last_sync_task_time = datetime.datetime.now()
+        self.sync_started = time.perf_counter()
+        self.schedule_sync()
+        self.run_in_background(
+            self.task_sync.fetch,
+            on_page=lambda tasks: self.dispatch(self.on_tasks_page, generation, tasks),
+            callback=lambda result: self.on_tasks_synced(generation, result),
+        )
+        return True
+
+    def schedule_sync(self):
+        if self.closed:
+            return
+        if self.push and self.push.connected:
+            delay = settings.PUSH_SYNC_INTERVAL_SECONDS
+        elif self.background:
+            delay = settings.BACKGROUND_SYNC_INTERVAL_SECONDS
+        else:
+            delay = settings.SYNC_INTERVAL_SECONDS
+        self.scheduler.cancel(self.sync_handle)
+        self.sync_handle = self.call_later(delay, self.on_sync_due)
+
+    def on_sync_due(self):
+        self.sync_handle = None
+        self.replay_journal()
+        if not self.sync_tasks(sync_interval_seconds=0):
+            self.schedule_sync()
+
+    def on_push_change(self):
+        if self.closed:
+            return
+        logger.info("tasks changed on the server")
+        # may be the opening tomato, abandoned or harvested on another device
+        self.sync_tasks(sync_interval_seconds=0, while_locked=True)
+
+    def on_tasks_page(self, generation, tasks: list[Task]):
+        if self.closed or self.task_sync.is_cancelled(generation):
+            return
+
+        self.task_store.apply(tasks)
+
+    def on_tasks_synced(self, generation, result: Optional[SyncResult]):
+        if self.task_sync.is_cancelled(generation):
+            return
+
+        self.syncing = False
+        if metrics.enabled:
+            metrics.record_ms("sync", self.sync_started)
+            if result:
+                metrics.record("sync tasks", len(result.tasks), COUNT_BOUNDS)
+        if result and not result.not_modified:
+            # a full result replaces the list, a delta drops the tombstones
+            self.task_store.apply(result.tasks, result.deleted_ids, full=result.full)
+
+            self.task_cache.set_meta('uid', self.client.uid)
+            self.task_cache.set_meta('watermark', self.task_sync.watermark)
+            self.task_cache.set_meta('etag', self.task_sync.etag)
+            self.task_cache.set_meta('last_modified', self.task_sync.last_modified)
+            self.schedule_cache_flush()
+
+            for task_id in list(self.tomato_states):
+                task = self.find_task(task_id)
+                if not task or task_state(task) is not TomatoState.DONE:
+                    # started, abandoned or harvested meanwhile
+                    del self.tomato_states[task_id]
+
+            task = self.find_task(self.lock_listen_task_id)
+            if self.lock_listen_task_id and (not task or task.opening_tomato_id <= 0):
+                # finished on another device
+                self.stop_lock_listen()
+            self.initial_lock_timer()
+        self.notify('on_synced', result)
+
+        self.run_sync_again()
+
+    def run_sync_again(self):
+        ''' The sync that was asked for while another one ran, or was dropped for a local action '''
+        if not self.sync_again:
+            return
+        while_locked = self.sync_again_while_locked
+        self.sync_again = self.sync_again_while_locked = False
+        self.sync_tasks(sync_interval_seconds=0, while_locked=while_locked)
+
+    def drop_running_sync(self):
+        ''' A sync read before a local action would undo it when applied, fetch again after the journal '''
+        if not self.syncing:
+            return
+        logger.info("drop the running sync, it was read before a local action")
+        self.task_sync.cancel()
+        self.syncing = False
+        self.sync_again = self.sync_again_while_locked = True
+
+    def tomato_state(self, task: Task) -> TomatoState:
+        return self.tomato_states.get(task.id) or task_state(task)
+
+    def advance_tomato(self, task: Task, *events, **changes) -> TomatoState:
+        ''' Move the tomato of `task` through `events` and apply `changes` to the task in one update
+
+        Raises:
+            InvalidTransition: nothing is changed
+        '''
+        state = self.tomato_state(task)
+        for event in events:
+            state = transition(state, event)
+        logger.info(f"tomato of task {task.id} {'+'.join(events)}: {state.value}")
+        if state is TomatoState.CREATED:
+            self.tomato_states[task.id] = state
+        else:
+            self.tomato_states.pop(task.id, None)
+        if changes:
+            self.task_store.update(task.id, **changes)
+        return state
+
+    def toggle_tomato(self, task: Task) -> str:
+        ''' Start, abandon or harvest the tomato of `task`, whichever its state allows
+
+        The action is journaled, applied locally right away and sent by the
+        replayer, the responses then correct the task, see apply_tomato_result.
+        Returns:
+            'start', 'abandon' or 'harvest'
+        '''
+        self.drop_running_sync()
+        state = self.tomato_state(task)
+        if state is TomatoState.IDLE:
+            tomato_id = self.journal.new_local_tomato_id()
+            # a server supporting it starts the tomato with the create, see send_journal_entry
+            self.journal.append('create', task.id, local_tomato_id=tomato_id, start=True)
+            self.journal.append('start', task.id, tomato_id=tomato_id)
+            self.advance_tomato(task, 'create', 'start', opening_tomato_id=tomato_id, opening_tomato_left_seconds=task.tomato_minute*60)
+            self.initial_lock_timer()
+            action = 'start'
+        elif state in (TomatoState.CREATED, TomatoState.RUNNING):
+            self.journal.append('abandon', task.id, tomato_id=task.opening_tomato_id)
+            if self.lock_listen_task_id == task.id:
+                self.stop_lock_listen()
+            self.advance_tomato(task, 'abandon', opening_tomato_id=-1, opening_tomato_left_seconds=0)
+            action = 'abandon'
+        else:
+            self.journal.append('harvest', task.id, tomato_id=task.opening_tomato_id)
+            self.advance_tomato(task, 'harvest', opening_tomato_id=-1, opening_tomato_left_seconds=0, tomato_number=task.tomato_number + 1)
+            action = 'harvest'
+
+        self.replay_journal()
+        return action
+
+    def replay_journal(self):
+        self.scheduler.cancel(self.replay_handle)
+        self.replay_handle = None
+        if self.replaying or not len(self.journal):
+            return
+
+        self.replaying = True
+        self.run_in_background(
+            self.journal.replay,
+            self.send_journal_entry,
+            settings.JOURNAL_BATCH_SIZE,
+            settings.JOURNAL_MAX_ATTEMPTS,
+            settings.JOURNAL_MAX_AGE_SECONDS,
+            callback=self.on_journal_replayed,
+        )
+
+    def send_journal_entry(self, entry: dict, tomato_id) -> Optional[dict]:
+        ''' Runs on the network executor
+
+        A create asks to start the tomato as well. When the response tells it
+        did, the start entry right after it is answered from that response
+        instead of another round trip.
+        '''
+        action = entry['action']
+        if action == 'create':
+            result = self.client.create_tomato(entry['task_id'], entry['key'], start=entry.get('start', False))
+            if result and result.get('is_ok') and 'left_seconds' in result:
+                self.started_tomatoes[entry['local_tomato_id']] = result
+            return result
+        if action == 'start':
+            started = self.started_tomatoes.pop(entry['tomato_id'], None)
+            if started:
+                return started
+            return self.client.start_tomato(tomato_id, entry['key'])
+        if action == 'abandon':
+            return self.client.abandon_tomato(tomato_id, entry['key'])
+        return self.client.harvest_tomato(tomato_id, entry['key'])
+
+    def on_journal_replayed(self, done: Optional[list]):
+        self.replaying = False
+        reconcile = False
+        for entry, result in done or []:
+            try:
+                reconcile |= not self.apply_tomato_result(entry, result)
+            except InvalidTransition as e:
+                # the task changed meanwhile, by a sync or another click
+                logger.info(f"{entry['action']} result of task {entry['task_id']}: {e}")
+                reconcile = True
+
+        if not len(self.journal):
+            if reconcile:
+                # the server refused something, fetch what it has instead
+                self.sync_again = self.sync_again_while_locked = True
+            self.run_sync_again()
+        elif done:
+            self.replay_journal()
+        else:
+            # offline, try again later
+            self.replay_handle = self.call_later(settings.JOURNAL_RETRY_SECONDS, self.replay_journal)
+
+    def apply_tomato_result(self, entry: dict, result: dict) -> bool:
+        ''' Correct the task of `entry` by the server's response
+
+        Returns:
+            False when the server refused the action and the task has to be fetched again
+        '''
+        task = self.find_task(entry['task_id'])
+        if not task:
+            return result['is_ok']
+        action = entry['action']
+        if action == 'create':
+            if task.opening_tomato_id != entry['local_tomato_id']:
+                # abandoned before the server answered
+                return result['is_ok']
+            if not result['is_ok']:
+                # the optimistic tomato never existed
+                if self.lock_listen_task_id == task.id:
+                    self.stop_lock_listen()
+                self.advance_tomato(task, 'reject', opening_tomato_id=-1, opening_tomato_left_seconds=0)
+                return False
+            self.task_store.update(task.id, opening_tomato_id=result['tomato_id'])
+            if self.lock_listen_task_id == task.id:
+                self.save_tomato_end(task)
+        elif action == 'start':
+            if task.opening_tomato_id <= 0 or self.tomato_state(task) is not TomatoState.RUNNING:
+                return result['is_ok']
+            if not result['is_ok']:
+                # created, but not counted down
+                if self.lock_listen_task_id == task.id:
+                    self.stop_lock_listen()
+                self.advance_tomato(task, 'stall', opening_tomato_left_seconds=0)
+                return False
+            self.adjust_lock(task, result['left_seconds'])
+        elif action == 'abandon':
+            if not result['is_ok']:
+                return False
+            self.notify('on_tips', f'已经累计放弃了 {result["abandon_count"]} 次')
+        elif action == 'harvest':
+            if not result['is_ok']:
+                return False
+            self.task_store.update(task.id, tomato_number=result['task_tomato_number'])
+            tips = f'收割成功，今日已经完成了{result["today_tomato_number"]}🍅'
+            if result.get('task_is_done'):
+                tips += f'，{task.title} 已经完成'
+            self.notify('on_tips', tips)
+        return True
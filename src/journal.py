@@ -0,0 +1,160 @@
+from pathlib import Path
+from typing import Callable, Optional
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+# tomatoes created offline get a local id until the server assigned one
+LOCAL_TOMATO_ID_BASE = 1 << 62
+
+
+def is_local_tomato_id(tomato_id) -> bool:
+    return tomato_id >= LOCAL_TOMATO_ID_BASE
+
+
+class Journal:
+    ''' Durable, append-only log of tomato actions waiting for the server
+
+    Every action is written and fsynced before it is applied locally, each with
+    a unique `key` sent as the idempotency key, so a retried request is never
+    applied twice. A line {"done": key, "result": ...} closes an action. The
+    file is compacted once nothing is pending, keeping a {"resolved": local id,
+    "tomato_id": ...} line for each local id resolved in the last
+    `keep_resolved` seconds: a task may still show the local id when the next
+    action on its tomato is appended, in this process or after a restart.
+    '''
+
+    def __init__(self, path, keep_resolved=24 * 60 * 60):
+        self.path = Path(path)
+        self.keep_resolved = keep_resolved
+        self.lock = threading.Lock()
+        self.entries: list[dict] = []
+        # local tomato id -> server tomato id, and when it was created
+        self.resolved: dict[int, int] = {}
+        self.resolved_at: dict[int, float] = {}
+        self.local_ids = itertools.count(LOCAL_TOMATO_ID_BASE + int(time.time() * 1000))
+        # key -> server errors of the entry in this process
+        self.attempts: dict[str, int] = {}
+        self.load()
+
+    def load(self):
+        if not self.path.exists():
+            return
+
+        entries = {}
+        for line in self.path.read_text(encoding="utf-8").splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # torn write of the last line
+                logger.warning(f"skip broken journal line {line!r}")
+                continue
+            if 'done' in record:
+                entry = entries.pop(record['done'], None)
+                if entry:
+                    self.resolve(entry, record['result'])
+            elif 'resolved' in record:
+                self.resolved[record['resolved']] = record['tomato_id']
+                self.resolved_at[record['resolved']] = record['created']
+            else:
+                entries[record['key']] = record
+        self.entries = list(entries.values())
+        logger.info(f"{len(self.entries)} pending journal entries")
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def new_local_tomato_id(self) -> int:
+        return next(self.local_ids)
+
+    def append(self, action, task_id, tomato_id=0, **extra) -> dict:
+        entry = dict(extra, key=uuid.uuid4().hex, action=action, task_id=task_id, tomato_id=tomato_id, created=time.time())
+        with self.lock:
+            self.write(entry)
+            self.entries.append(entry)
+        return entry
+
+    def pending(self) -> list[dict]:
+        with self.lock:
+            return list(self.entries)
+
+    def tomato_id(self, entry) -> Optional[int]:
+        ''' Server id of the entry's tomato, None while its create is pending '''
+        tomato_id = entry['tomato_id']
+        if is_local_tomato_id(tomato_id):
+            return self.resolved.get(tomato_id)
+        return tomato_id
+
+    def resolve(self, entry, result):
+        if entry['action'] == 'create' and result.get('is_ok') and 'local_tomato_id' in entry:
+            self.resolved[entry['local_tomato_id']] = result['tomato_id']
+            self.resolved_at[entry['local_tomato_id']] = entry['created']
+
+    def mark_done(self, entry, result: dict):
+        with self.lock:
+            self.write({'done': entry['key'], 'result': result})
+            self.resolve(entry, result)
+            self.entries = [x for x in self.entries if x['key'] != entry['key']]
+            if not self.entries:
+                self.compact()
+
+    def replay(self, send: Callable[[dict, int], Optional[dict]], batch_size=20, max_attempts=5, max_age=None) -> list[tuple[dict, dict]]:
+        ''' Send up to `batch_size` pending entries in order
+
+        `send(entry, tomato_id)` returns the server response, or None when the
+        server could not be reached, which stops the replay so the order holds.
+        A response with `retry` (a server error) stops it too, until the entry
+        failed `max_attempts` times. Then, or once it is older than `max_age`
+        seconds, the entry is given up and closed as failed.
+        Returns:
+            the (entry, result) pairs that were applied
+        '''
+        done = []
+        for entry in self.pending()[:batch_size]:
+            tomato_id = self.tomato_id(entry)
+            if entry['action'] != 'create' and tomato_id is None:
+                # its create was rejected, there is nothing to act on
+                result = {'is_ok': False, 'reason': 'tomato was not created'}
+            elif max_age is not None and time.time() - entry['created'] > max_age:
+                result = {'is_ok': False, 'reason': 'given up, too old'}
+            else:
+                result = send(entry, tomato_id)
+                if result is None:
+                    break
+                if result.get('retry'):
+                    attempts = self.attempts[entry['key']] = self.attempts.get(entry['key'], 0) + 1
+                    if attempts < max_attempts:
+                        break
+                    logger.warning(f"give up {entry['action']} of task {entry['task_id']} after {attempts} server errors")
+            self.attempts.pop(entry['key'], None)
+            self.mark_done(entry, result)
+            done.append((entry, result))
+        return done
+
+    def write(self, record):
+        with self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compact(self):
+        expired = time.time() - self.keep_resolved
+        for local_id in [k for k, v in self.resolved_at.items() if v < expired]:
+            del self.resolved[local_id]
+            del self.resolved_at[local_id]
+
+        tmp = self.path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for local_id, tomato_id in self.resolved.items():
+                f.write(json.dumps({'resolved': local_id, 'tomato_id': tomato_id, 'created': self.resolved_at[local_id]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
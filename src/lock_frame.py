@@ -1,32 +1,39 @@
 from typing import Optional
 import wx
-import wx.media
 import logging
-import datetime
-import doctest
+import math
 
 import settings
 from models import Task, User
 from base_frame import BaseFrame
 from canvas import Canvas
+from engine import rest_seconds
 
 
 logger = logging.getLogger(__name__)
 
 
 class LockFrame(BaseFrame):
+    ''' The forced rest, built hidden ahead of time and shown by `start` when the tomato is due
 
-    def __init__(self, task: Task, *args, **kw):
+    Without a prefetched `user` the rest starts with REST_SECONDS and becomes
+    the long one once the user arrives.
+    '''
+
+    REST_SECONDS = settings.REST_SECONDS
+    QUIT_DELAY_SECONDS = 40
+
+    def __init__(self, task: Task, user: Optional[User], *args, **kw):
         super().__init__(*args, **kw)
         self.task = task
-        self.stop_timer = wx.Timer(self)
-        self.countdown_seconds = 300
-        self.init_countdown_seconds()
-        self.countdown_timer = wx.Timer(self)
-        self.quit_timer = wx.Timer(self)
+        self.user = user
+        self.rest_seconds = rest_seconds(user) if user else self.REST_SECONDS
+        self.rest_start = None
+        self.stop_handle = None
+        self.countdown_handle = None
 
         box = wx.BoxSizer(orient=wx.VERTICAL)
-        self.canvas = Canvas(self, self.countdown_seconds, self.BG_COLOR, "离开电脑，走动走动")
+        self.canvas = Canvas(self, self.rest_seconds, self.BG_COLOR, "离开电脑，走动走动")
         self.canvas.SetMinSize(self.Parent.lock_frame_size)
         box.Add(self.canvas, wx.EXPAND)
 
@@ -39,78 +46,68 @@ class LockFrame(BaseFrame):
         self.SetWindowStyle(self.GetWindowStyle() & ~wx.MINIMIZE_BOX)
 
         self.SetTitle(self.task.title)
+        self.Center()
+
+    def start(self):
+        self.rest_start = self.scheduler.clock()
         self.Show()
         self.Raise()
-        self.Center()
 
         # ready to rest
-        self.Bind(wx.EVT_TIMER, self.countdown, self.countdown_timer)
-        self.countdown_timer.Start(1000)
-
-        self.Bind(wx.EVT_TIMER, self.stop_lock, self.stop_timer)
-        self.stop_timer.StartOnce(1000*self.countdown_seconds)
+        self.stop_handle = self.call_at(self.rest_deadline(), self.stop_lock)
+        self.schedule_countdown()
 
         self.play_music(str(settings.TOMATO_DONE_MP3))
+        if self.user:
+            self.show_user(self.user)
+        else:
+            self.init_countdown_seconds()
+
+    def rest_deadline(self) -> float:
+        return self.rest_start + self.rest_seconds
+
+    def left_seconds(self) -> int:
+        return max(0, math.ceil(self.rest_deadline() - self.scheduler.clock()))
 
     def init_countdown_seconds(self):
-        user = self.get_user_info()
+        self.run_in_background(self.client.get_user_info, on_error=self.set_error_tips, callback=self.on_user_info)
+
+    def on_user_info(self, user: Optional[User]):
         if not user:
             return
-        if user.today_tomato_count % 4 == 0:
-            self.countdown_seconds = 30*60
-        
+        if rest_seconds(user) != self.rest_seconds and self.stop_handle:
+            # long rest, counted from the same start
+            self.rest_seconds = rest_seconds(user)
+            self.canvas.set_seconds(self.rest_seconds)
+            self.scheduler.cancel(self.stop_handle)
+            self.stop_handle = self.call_at(self.rest_deadline(), self.stop_lock)
+        self.show_user(user)
+
+    def show_user(self, user: User):
         self.set_tips(f"今日已经成功完成了{user.today_tomato_count}🍂。当前还有{user.left_tomato_number}🍂")
 
-    def stop_lock(self, event):
-        self.countdown_timer.Destroy()
-        self.stop_timer.Destroy()
+    def stop_lock(self):
+        self.stop_handle = None
+        self.scheduler.cancel(self.countdown_handle)
+        self.countdown_handle = None
         
         self.play_music(str(settings.REST_DONE_MP3))
         
-        self.Bind(wx.EVT_TIMER, self.quit, self.quit_timer)
-        self.quit_timer.StartOnce(40*1000)
+        self.call_later(self.QUIT_DELAY_SECONDS, self.quit)
 
-    def quit(self, event):
+    def quit(self):
         logger.info("to close")
-        self.quit_timer.Destroy()
         self.Close()
 
-    def countdown(self, event):
-        self.countdown_seconds -= 1
-        logger.info(f"countdown {self.countdown_seconds}")
-        self.SetTitle(f"{self.task.title} - 休息倒计时 {self.format_seconds(self.countdown_seconds)}")
-        self.canvas.update(self.countdown_seconds)
-
-    def get_user_info(self) -> Optional[User]:
-        url = self.pack_url("/mobile/user/info/")
-        params = {
-            'user_id': self.uid,
-        }
-
-        r = self.request("GET", url, params=params)
-        if not r:
-            return None
-
-        data = r.json()
-        if data['is_ok'] is False:
-            self.set_error_tips(data['reason'])
-            return None
-        
-        item = data['user']
-        user = User(
-            uid=item['uid'], 
-            username=item['username'],
-            sex_name = item['sex_name'],
-            left_tomato_number=item['left_tomato_number'],
-            email=item['email'],
-            upload_header_url=item['upload_header_url'],
-            is_vip=item['is_vip'],
-            today_tomato_count=data['today_tomato_count']
-        )
-        return user
-        
-
-
+    def schedule_countdown(self):
+        ''' Wake up when the displayed second changes '''
+        remaining = self.rest_deadline() - self.scheduler.clock()
+        if remaining <= 0:
+            return
+        self.countdown_handle = self.call_at(self.rest_deadline() - (math.ceil(remaining) - 1), self.countdown)
 
-if __name__ == "__main__":
-    doctest.testmod()
+    def countdown(self):
+        left_seconds = self.left_seconds()
+        self.SetTitle(f"{self.task.title} - 休息倒计时 {self.format_seconds(left_seconds)}")
+        self.canvas.update(left_seconds)
+        self.schedule_countdown()
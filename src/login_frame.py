@@ -1,9 +1,6 @@
+from typing import Optional
 import wx
-import requests
 import logging
-import traceback
-import json
-import settings
 from base_frame import BaseFrame
 
 
@@ -43,24 +40,18 @@ class LoginFrame(BaseFrame):
         self.Raise()
 
     def on_button_click(self, event):
-        url = f'https://{settings.SERVER_HOST}/account/mobile/get_token/'
-        params = {
-            'username': self.username_text.GetValue(),
-            'password': self.password_text.GetValue()
-        }
-        r = self.request('GET', url, params=params)
-        if not r:
-            return
-        
-        if r.status_code != 200:
-            logger.warn(f"get {url} failed: status code {r.status_code}, response {r.text}")
-            self.set_error_tips(r.text)
-            return
-        data = r.json()
-        logger.info(f'response {data}')
-        if data['is_ok'] is False:
-            logger.warning(f"failed to login: {data}")
-            self.set_error_tips(f'登陆失败, {data["reason"]}')
+        self.login_btn.Disable()
+        self.run_in_background(
+            self.client.get_token,
+            self.username_text.GetValue(),
+            self.password_text.GetValue(),
+            on_error=self.set_error_tips,
+            callback=self.on_token,
+        )
+
+    def on_token(self, data: Optional[dict]):
+        if not data:
+            self.login_btn.Enable()
             return
             
         self.on_success(data)
@@ -69,10 +60,10 @@ class LoginFrame(BaseFrame):
         self.status_bar.SetStatusText("登陆成功")
         self.username_text.SetEditable(False)
         self.password_text.SetEditable(False)
-        settings.TOKEN_PATH.write_text(json.dumps(data))
+        self.client.save_token(data)
 
         self.Close()
 
-        self.parent_frame.initial_token()
+        self.parent_frame.on_login()
         self.parent_frame.Show()
 
@@ -0,0 +1,88 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import logging
+import queue
+import re
+import time
+
+
+FORMAT = "%(asctime)s-%(levelname)s %(filename)s:%(lineno)s:: %(message)s"
+
+SECRET_PATTERN = re.compile(r"""(['"]?(?:secret|password|token)['"]?\s*[:=]\s*['"]?)[^'"&,\s}]+""", re.IGNORECASE)
+
+listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    ''' Let at most `limit` records below WARNING through per call site and `window` seconds '''
+
+    def __init__(self, limit, window=10.0):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        # (pathname, lineno) -> [window start, count]
+        self.counters: dict[tuple, list] = {}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        counter = self.counters.get(key)
+        if counter is None or now - counter[0] >= self.window:
+            self.counters[key] = [now, 1]
+            return True
+        counter[1] += 1
+        return counter[1] <= self.limit
+
+
+class RedactFilter(logging.Filter):
+    ''' Mask secrets and cut long messages, runs on the listener thread
+
+    >>> record = logging.LogRecord("x", logging.INFO, "", 0, "params {'secret': 'abc', 'uid': 1}", None, None)
+    >>> RedactFilter(100).filter(record) and record.msg
+    "params {'secret': '***', 'uid': 1}"
+    '''
+
+    def __init__(self, max_length):
+        super().__init__()
+        self.max_length = max_length
+
+    def filter(self, record):
+        message = SECRET_PATTERN.sub(r"\1***", record.getMessage())
+        if len(message) > self.max_length:
+            message = f"{message[:self.max_length]}... ({len(message)} chars)"
+        record.msg = message
+        record.args = None
+        return True
+
+
+def setup(path, level, max_bytes, backup_count, rate_limit, max_length):
+    ''' Log through a queue to a rotating file written on a background thread '''
+    global listener
+    if listener is not None:
+        return
+
+    file_handler = RotatingFileHandler(str(path), maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(FORMAT))
+    file_handler.addFilter(RedactFilter(max_length))
+
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter(rate_limit))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown():
+    ''' Write out what is still queued, logging after this is dropped '''
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
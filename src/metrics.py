@@ -0,0 +1,104 @@
+from bisect import bisect_left
+import json
+import threading
+import time
+
+
+# upper bounds of the buckets, the last one catches everything above
+MS_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000)
+BYTES_BOUNDS = tuple(256 * 4 ** i for i in range(10))
+COUNT_BOUNDS = (1, 10, 100, 1000, 10000, 100000)
+
+
+class Histogram:
+    ''' Fixed buckets, so recording is a bisect and memory never grows
+
+    >>> h = Histogram((1, 10, 100))
+    >>> for value in (0.5, 5, 5, 50, 500): h.add(value)
+    >>> h.snapshot()["p50"], h.snapshot()["max"]
+    (10, 500)
+    '''
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.buckets[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        ''' Upper bound of the bucket holding the q quantile '''
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return 0
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": {("+inf" if i == len(self.bounds) else str(self.bounds[i])): n for i, n in enumerate(self.buckets) if n},
+        }
+
+
+class Metrics:
+    ''' Latency and size histograms of the running client
+
+    Call sites check `enabled` before taking any timing, so a disabled
+    instance costs one attribute read. `dump` writes everything as json.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.histograms: dict[str, Histogram] = {}
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.time()
+
+    def record(self, name, value, bounds=MS_BOUNDS):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.add(value)
+
+    def record_ms(self, name, started):
+        ''' `started` is a time.perf_counter() value '''
+        self.record(name, (time.perf_counter() - started) * 1000)
+
+    def record_bytes(self, name, size):
+        self.record(name, size, BYTES_BOUNDS)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "started": self.started,
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "histograms": {name: self.histograms[name].snapshot() for name in sorted(self.histograms)},
+            }
+
+    def dump(self, path, **extra):
+        data = dict(self.snapshot(), **extra)
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        return data
+
+
+metrics = Metrics()
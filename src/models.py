@@ -1,7 +1,26 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Optional
+import datetime
+import sys
 
+from converter import Converter
 
-@dataclass
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value) -> int:
+    ''' Epoch seconds of a server datetime "%Y-%m-%d %H:%M:%S", 0 when it can not be parsed
+
+    >>> parse_datetime("")
+    0
+    '''
+    try:
+        return int(datetime.datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+@dataclass(slots=True)
 class Task:
     id: int = -1
     title: str = ""
@@ -14,9 +33,24 @@ class Task:
     dead_datetime: str = ""
     expect_tomato_number: int = 0
     tomato_number: int = 0
+    # derived from the fields above by refresh()
+    last_update_epoch: int = field(default=0, init=False, repr=False, compare=False)
+    dead_epoch: int = field(default=0, init=False, repr=False, compare=False)
+    # list label, formatted on first use
+    label: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
+    def __post_init__(self):
+        self.refresh()
 
-@dataclass
+    def refresh(self):
+        ''' Parse the datetimes again and drop the label, after fields were changed in place '''
+        self.project = sys.intern(self.project)
+        self.last_update_epoch = parse_datetime(self.last_update_datetime)
+        self.dead_epoch = parse_datetime(self.dead_datetime)
+        self.label = None
+
+
+@dataclass(slots=True)
 class User:
     uid: int = 0
     username: str = ''
@@ -27,4 +61,7 @@ class User:
     is_vip: bool = False
     today_tomato_count: int =0
 
-    
\ No newline at end of file
+
+# api dicts -> models, see Converter
+parse_tasks = Converter(Task, required=('id',))
+parse_users = Converter(User, required=('uid',))
@@ -0,0 +1,141 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import importlib.util
+import json
+import logging
+import os
+import threading
+
+import settings
+
+
+logger = logging.getLogger(__name__)
+
+default_executor = None
+default_executor_lock = threading.Lock()
+
+default_session = None
+default_session_lock = threading.Lock()
+
+
+class NetworkExecutor:
+    ''' Run blocking network jobs on worker threads.
+
+    Results are handed to `callback` (or the exception to `errback`) through
+    `dispatch`, which the gui sets to `wx.CallAfter` so the ui thread only ever
+    applies finished results.
+    '''
+
+    def __init__(self, max_workers=4, dispatch=None):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="network")
+        self.dispatch = dispatch
+
+    @classmethod
+    def get_default(cls) -> "NetworkExecutor":
+        global default_executor
+        with default_executor_lock:
+            if default_executor is None:
+                default_executor = cls(max_workers=settings.NETWORK_WORKERS)
+            return default_executor
+
+    def submit(self, fn, *args, callback=None, errback=None, **kwargs) -> Future:
+        future = self.pool.submit(fn, *args, **kwargs)
+        if callback or errback:
+            future.add_done_callback(lambda f: self.deliver(f, callback, errback))
+        return future
+
+    def deliver(self, future: Future, callback, errback):
+        if future.cancelled():
+            return
+
+        exc = future.exception()
+        if exc is not None:
+            logger.warning(f"background job failed: {exc!r}")
+            if errback:
+                self.call(errback, exc)
+            return
+
+        if callback:
+            self.call(callback, future.result())
+
+    def call(self, fn, *args):
+        if self.dispatch:
+            self.dispatch(fn, *args)
+        else:
+            fn(*args)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def has_module(name) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+if has_module("orjson"):
+    import orjson
+    loads = orjson.loads
+else:
+    loads = json.loads
+
+
+def http_ok(r) -> bool:
+    ''' `r` was answered without an http error, the same for requests and httpx responses
+
+    requests makes a response falsy on 4xx/5xx, httpx has no such truth value.
+    '''
+    return r is not None and r.status_code < 400
+
+
+def decode_json(r):
+    ''' Body of the response `r` decoded in one pass, by orjson when it is installed '''
+    return loads(r.content)
+
+
+def accept_encoding() -> str:
+    encodings = ["gzip", "deflate"]
+    if has_module("brotli") or has_module("brotlicffi"):
+        encodings.append("br")
+    return ", ".join(encodings)
+
+
+def get_session():
+    ''' Process wide pooled http session shared by every frame '''
+    global default_session
+    with default_session_lock:
+        if default_session is None:
+            default_session = create_session()
+        return default_session
+
+
+def create_session():
+    ''' Keep-alive session with `settings.HTTP_POOL_SIZE` connections per host.
+
+    Uses httpx over HTTP/2 when `settings.HTTP2` is on and httpx/h2 are installed,
+    requests otherwise. The SSL_CERT_FILE override is applied once here.
+    '''
+    headers = {
+        'Accept-Encoding': accept_encoding(),
+    }
+    cert = os.environ.get('SSL_CERT_FILE') or None
+
+    if settings.HTTP2 and has_module("httpx") and has_module("h2"):
+        import httpx
+
+        limits = httpx.Limits(max_connections=settings.HTTP_POOL_SIZE, max_keepalive_connections=settings.HTTP_POOL_SIZE)
+        logger.info("use httpx session with http2")
+        # requests follows redirects, httpx only when asked to
+        return httpx.Client(http2=True, limits=limits, headers=headers, cert=cert, verify=not cert, follow_redirects=True)
+
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.HTTP_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(headers)
+    session.headers['Connection'] = 'keep-alive'
+    if cert:
+        session.cert = cert
+        session.verify = False
+    return session
@@ -0,0 +1,110 @@
+from typing import Callable, Optional
+import logging
+import threading
+
+import settings
+from network import decode_json, http_ok
+
+
+logger = logging.getLogger(__name__)
+
+
+class PushUnavailable(Exception):
+    pass
+
+
+class PushChannel:
+    ''' Long-poll subscription to the task changes of /mobile/task/events/
+
+    The server holds each request until something changed after `cursor` or
+    `timeout` seconds passed, and answers {"cursor": n, "changed": bool}. The
+    first request only learns the cursor. After a disconnect the last cursor
+    is sent again, so nothing that happened meanwhile is missed, with an
+    exponential backoff up to PUSH_RETRY_MAX_SECONDS. A server without the
+    endpoint (404) ends the channel for good and the caller keeps polling.
+
+    Runs on its own thread so the long requests never block a network worker.
+    `on_change()` and `on_state(connected)` are called from that thread.
+    '''
+    PATH = "/mobile/task/events/"
+
+    def __init__(self, client, on_change: Callable[[], None], on_state: Callable[[bool], None], timeout=settings.PUSH_TIMEOUT_SECONDS):
+        self.client = client
+        self.on_change = on_change
+        self.on_state = on_state
+        self.timeout = timeout
+        self.cursor: Optional[int] = None
+        self.connected = False
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="push", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def set_connected(self, connected):
+        if connected != self.connected:
+            self.connected = connected
+            logger.info(f"push connected {connected}")
+            self.on_state(connected)
+
+    def run(self):
+        try:
+            self.listen()
+        finally:
+            self.set_connected(False)
+
+    def listen(self):
+        delay = 0
+        while not self.stopped.is_set():
+            try:
+                changed = self.poll()
+            except PushUnavailable:
+                logger.info("push is not supported by the server, keep polling")
+                return
+            except Exception as e:
+                # not json, a captive portal page or a body without the fields
+                logger.warning(f"push response is broken: {e!r}")
+                changed = None
+
+            if self.stopped.is_set():
+                return
+            if changed is None:
+                self.set_connected(False)
+                delay = min(max(1, delay * 2), settings.PUSH_RETRY_MAX_SECONDS)
+                self.stopped.wait(delay)
+                continue
+
+            delay = 0
+            self.set_connected(True)
+            if changed:
+                self.on_change()
+
+    def poll(self) -> Optional[bool]:
+        ''' Whether something changed, None when the server could not be reached '''
+        params = {'timeout': self.timeout}
+        if self.cursor is not None:
+            params['cursor'] = self.cursor
+        r = self.client.request(
+            'GET',
+            self.client.pack_url(self.PATH),
+            params=params,
+            timeout=self.timeout + settings.HTTP_TIMEOUT,
+            on_error=lambda msg: logger.info(f"push request failed: {msg}"),
+        )
+        if r is None:
+            return None
+        if r.status_code == 404:
+            raise PushUnavailable()
+        if not http_ok(r):
+            return None
+
+        data = decode_json(r)
+        if not data.get('is_ok'):
+            return None
+        first = self.cursor is None
+        self.cursor = data['cursor']
+        return data['changed'] and not first
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Hashable, Optional, TypeVar
+import logging
+import threading
+import time
+
+import settings
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ReadCache:
+    ''' Single flight and a small TTL/LRU cache for read-mostly api calls
+
+    Concurrent `get`s of the same key share one fetch, the others wait on its
+    result. A result that is not None is kept for `ttl` seconds, the least
+    recently used one is dropped beyond `maxsize`. `invalidate` after a write
+    that changes what a key reads, a fetch running meanwhile is not cached.
+    Cached values are shared between callers: do not modify them.
+
+    >>> cache = ReadCache()
+    >>> cache.get("a", lambda: 1, ttl=60), cache.get("a", lambda: 2, ttl=60)
+    (1, 1)
+    >>> cache.invalidate("a")
+    >>> cache.get("a", lambda: 2, ttl=60)
+    2
+    '''
+
+    def __init__(self, maxsize=settings.READ_CACHE_SIZE, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.lock = threading.Lock()
+        # key -> (expires, value)
+        self.entries: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+        self.inflight: dict[Hashable, Future] = {}
+        self.generation = 0
+
+    def get(self, key: Hashable, fetch: Callable[[], Optional[T]], ttl) -> Optional[T]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > self.clock():
+                self.entries.move_to_end(key)
+                return entry[1]
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+                generation = self.generation
+
+        if not leader:
+            logger.debug(f"join the running read of {key!r}")
+            return future.result()
+
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self.lock:
+                del self.inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.inflight[key]
+            if value is not None and generation == self.generation:
+                self.entries[key] = (self.clock() + ttl, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        ''' Drop `key`, everything when None '''
+        with self.lock:
+            self.generation += 1
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
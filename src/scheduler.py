@@ -0,0 +1,76 @@
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+import heapq
+import itertools
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(order=True)
+class Handle:
+    deadline: float
+    seq: int
+    fn: Callable = field(compare=False)
+    args: tuple = field(compare=False, default=())
+    cancelled: bool = field(compare=False, default=False)
+
+
+class Scheduler:
+    ''' Heap of absolute `time.monotonic()` deadlines
+
+    Only the nearest deadline is ever armed: `arm(delay)` is called with the
+    seconds until it, or None when nothing is due, and the owner of the real
+    timer calls `run_due` when it fires.
+    '''
+
+    def __init__(self, arm: Callable[[Optional[float]], None], clock=time.monotonic):
+        self.arm = arm
+        self.clock = clock
+        self.heap: list[Handle] = []
+        self.seq = itertools.count()
+        self.armed_deadline: Optional[float] = None
+
+    def call_at(self, deadline, fn, *args) -> Handle:
+        handle = Handle(deadline, next(self.seq), fn, args)
+        heapq.heappush(self.heap, handle)
+        if self.armed_deadline is None or deadline < self.armed_deadline:
+            self.rearm()
+        return handle
+
+    def call_later(self, delay, fn, *args) -> Handle:
+        return self.call_at(self.clock() + delay, fn, *args)
+
+    def cancel(self, handle: Optional[Handle]):
+        if handle is None or handle.cancelled:
+            return
+        handle.cancelled = True
+        if self.heap and self.heap[0] is handle:
+            self.rearm()
+
+    def run_due(self):
+        now = self.clock()
+        while self.heap and (self.heap[0].cancelled or self.heap[0].deadline <= now):
+            handle = heapq.heappop(self.heap)
+            if handle.cancelled:
+                continue
+            handle.cancelled = True
+            try:
+                handle.fn(*handle.args)
+            except Exception:
+                logger.exception(f"scheduled call {handle.fn} failed")
+        self.rearm()
+
+    def rearm(self):
+        while self.heap and self.heap[0].cancelled:
+            heapq.heappop(self.heap)
+
+        if not self.heap:
+            self.armed_deadline = None
+            self.arm(None)
+            return
+
+        self.armed_deadline = self.heap[0].deadline
+        self.arm(max(0.0, self.armed_deadline - self.clock()))
@@ -15,25 +15,89 @@ APP_NAME = '行恒'
 
 WORK_DIR = Path(os.path.expanduser("~")) / ".xingheng"
 
-if WORK_DIR.exists() is False:
-    WORK_DIR.mkdir(parents=True)
-
 BASE_DIR = Path(os.path.dirname(__file__))
 
-logging.basicConfig(level=LEVEL, filename=str(BASE_DIR/ "debug.log"), filemode="w", format="%(asctime)s-%(levelname)s %(filename)s:%(lineno)s:: %(message)s")
-
 TOKEN_PATH = WORK_DIR / "token.json"
+# how often the token file is checked for a login of another process
+TOKEN_CHECK_SECONDS = 5
+# read-mostly api results, see read_cache.py
+READ_CACHE_SIZE = 32
+USER_INFO_TTL_SECONDS = 60
+CACHE_PATH = WORK_DIR / "cache.sqlite3"
+CACHE_FLUSH_SECONDS = 5
+JOURNAL_PATH = WORK_DIR / "journal.jsonl"
+JOURNAL_BATCH_SIZE = 20
+JOURNAL_RETRY_SECONDS = 15
+# an action the server keeps failing, or too old to matter, is given up
+JOURNAL_MAX_ATTEMPTS = 5
+JOURNAL_MAX_AGE_SECONDS = 24 * 60 * 60
+
+LOG_PATH = WORK_DIR / "debug.log"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+# records below WARNING per call site every 10 seconds
+LOG_RATE_LIMIT = 5
+LOG_MAX_LENGTH = 2000
 
-SERVER_HOST = "www.51zhi.com"
+# also enabled by `app.py --metrics`, dumped from the tray menu
+METRICS_ENABLED = os.environ.get("XINGHENG_METRICS") == "1"
+METRICS_PATH = WORK_DIR / "metrics.json"
+
+SERVER_HOST = os.environ.get("XINGHENG_SERVER_HOST", "www.51zhi.com")
+# http is only meant for the local stub server, see stub_server.py
+SERVER_SCHEME = os.environ.get("XINGHENG_SERVER_SCHEME", "https")
 
 TOMATO_DONE_MP3 = BASE_DIR / "resources/mp3" / "tomato_done.mp3"
 REST_DONE_MP3 = BASE_DIR / "resources/mp3" / "rest_done.mp3"
 TOMATO_START_MP3 = BASE_DIR / "resources/mp3" / "horse.caf"
 
 APP_BUILD = 202401
-APP_PLATFORM = platform.uname().system
-APP_VERSION = platform.uname().release
+# filled by init()
+APP_PLATFORM = ""
+APP_VERSION = ""
 
 LOGO_PATH = str(BASE_DIR / "resources/images/logo.icns")
 
-APP_SIZE = (800, 600)
\ No newline at end of file
+APP_SIZE = (800, 600)
+
+NETWORK_WORKERS = 4
+HTTP_TIMEOUT = 15
+SYNC_INTERVAL_SECONDS = 30
+BACKGROUND_SYNC_INTERVAL_SECONDS = 300
+SYNC_PAGE_SIZE = 100
+SYNC_PAGE_WORKERS = 3
+# task changes are pushed through a long-poll, polling stays as a slow safety net
+PUSH_ENABLED = True
+PUSH_TIMEOUT_SECONDS = 25
+PUSH_RETRY_MAX_SECONDS = 60
+PUSH_SYNC_INTERVAL_SECONDS = 300
+
+REST_SECONDS = 5 * 60
+LONG_REST_SECONDS = 30 * 60
+# the n-th tomato of the day earns the long rest
+LONG_REST_EVERY = 4
+# the lock screen is built hidden and the user fetched this long before a tomato ends
+LOCK_PREPARE_SECONDS = 30
+# the network workers, the sync page workers and the push long-poll share one session
+HTTP_POOL_SIZE = NETWORK_WORKERS + SYNC_PAGE_WORKERS + 1
+# only used when httpx and h2 are installed
+HTTP2 = True
+
+initialized = False
+
+
+def init():
+    ''' Side effects of the settings: work dir, logging and platform info. Run once at startup '''
+    global initialized, APP_PLATFORM, APP_VERSION
+    if initialized:
+        return
+    initialized = True
+
+    WORK_DIR.mkdir(parents=True, exist_ok=True)
+
+    import logs
+    logs.setup(LOG_PATH, LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_RATE_LIMIT, LOG_MAX_LENGTH)
+
+    uname = platform.uname()
+    APP_PLATFORM = uname.system
+    APP_VERSION = uname.release
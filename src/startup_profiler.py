@@ -0,0 +1,53 @@
+from typing import Optional
+import json
+import logging
+import sys
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler:
+    ''' Wall time of each startup phase, enabled by `--profile-startup`
+
+    `mark(phase)` closes the phase that ran since the previous mark, `report`
+    logs the phases, prints them as json to stderr and writes them to `path`.
+    Both are no-ops while disabled.
+    '''
+
+    def __init__(self):
+        self.enabled = False
+        self.started_at = 0.0
+        self.last = 0.0
+        self.phases: dict[str, float] = {}
+        self.reported = False
+
+    def enable(self, started_at: Optional[float] = None):
+        self.enabled = True
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.last = self.started_at
+
+    def mark(self, phase):
+        if not self.enabled or phase in self.phases:
+            return
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self.last) * 1000, 2)
+        self.last = now
+
+    def report(self, path=None):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        data = {
+            "phases_ms": self.phases,
+            "total_ms": round((self.last - self.started_at) * 1000, 2),
+        }
+        text = json.dumps(data, ensure_ascii=False)
+        logger.warning(f"startup profile {text}")
+        print(text, file=sys.stderr)
+        if path:
+            path.write_text(text)
+
+
+startup_profiler = StartupProfiler()
@@ -0,0 +1,325 @@
+''' Local stand-in for the 51zhi.com api, for working offline
+
+Usage:
+    python stub_server.py --port 8000 --tasks 50 --latency 80 --failure-rate 0.05
+    XINGHENG_SERVER_SCHEME=http XINGHENG_SERVER_HOST=127.0.0.1:8000 python app.py
+'''
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import datetime
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def now_str() -> str:
+    return datetime.datetime.now().strftime(DATETIME_FORMAT)
+
+
+class StubState:
+    ''' Tasks of a single user, with tombstones for removed tasks
+
+    Tombstones older than `tombstone_horizon` are forgotten, a `since` before it
+    can no longer be answered with a delta and is rejected with `full_resync`.
+    '''
+
+    def __init__(self, task_count=10, tomato_seconds=None):
+        self.lock = threading.Lock()
+        # notified on every version change, for the long-poll of /mobile/task/events/
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+        self.tasks: dict[int, dict] = {}
+        self.tombstones: dict[int, str] = {}
+        self.tombstone_horizon = now_str()
+        for i in range(1, task_count + 1):
+            self.put_task(make_task(i))
+
+        # overrides the tomato_minute of the tasks, for short benchmark tomatoes
+        self.tomato_seconds = tomato_seconds
+        self.tomato_ids = itertools.count(1)
+        self.tomatoes: dict[int, dict] = {}
+        # idempotency key -> the response sent for it
+        self.responses: dict[str, dict] = {}
+        self.user = make_user()
+        self.abandon_count = 0
+
+    def put_task(self, task: dict):
+        with self.lock:
+            task['last_update_datetime'] = now_str()
+            self.tasks[task['id']] = task
+            self.tombstones.pop(task['id'], None)
+            self.version += 1
+            self.changed.notify_all()
+
+    def remove_task(self, task_id):
+        with self.lock:
+            if self.tasks.pop(task_id, None) is not None:
+                self.tombstones[task_id] = now_str()
+                self.version += 1
+            self.changed.notify_all()
+
+    def forget_tombstones(self):
+        with self.lock:
+            self.tombstones.clear()
+            self.tombstone_horizon = now_str()
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, cursor, timeout) -> dict:
+        ''' Long-poll: answer once the version passed `cursor`, or after `timeout` seconds
+
+        No cursor or one from before a restart is answered right away with the current one.
+        '''
+        with self.changed:
+            if cursor is None or cursor > self.version:
+                return {"is_ok": True, "cursor": self.version, "changed": cursor is not None}
+            changed = self.changed.wait_for(lambda: self.version > cursor, timeout)
+            return {"is_ok": True, "cursor": self.version, "changed": changed}
+
+    def etag(self) -> str:
+        return f'"v{self.version}"'
+
+    def valid_since(self, since) -> bool:
+        ''' Empty, or a watermark the tombstones still cover '''
+        return not since or (is_datetime(since) and since >= self.tombstone_horizon)
+
+    def list_tasks(self, since, page, page_size) -> dict:
+        with self.lock:
+            if not self.valid_since(since):
+                return {"is_ok": False, "reason": f"invalid since {since}", "full_resync": True}
+
+            tasks = sorted(self.tasks.values(), key=lambda x: x['id'], reverse=True)
+            # same second updates are sent again, the client merge is idempotent
+            deleted_ids = []
+            if since:
+                tasks = [x for x in tasks if x['last_update_datetime'] >= since]
+                deleted_ids = [k for k, v in self.tombstones.items() if v >= since]
+
+            total = len(tasks)
+            start = (page - 1) * page_size
+            return {
+                "is_ok": True,
+                "tasks": tasks[start:start + page_size],
+                "total": total,
+                "deleted_ids": deleted_ids,
+                "is_delta": bool(since),
+                "watermark": max([since or ""] + [x['last_update_datetime'] for x in self.tasks.values()] + list(self.tombstones.values())),
+            }
+
+
+    def idempotent(self, key, action) -> dict:
+        ''' Same key, same response, the action runs once '''
+        with self.lock:
+            if key and key in self.responses:
+                return self.responses[key]
+        response = action()
+        if key:
+            with self.lock:
+                self.responses[key] = response
+        return response
+
+    def create_tomato(self, task_id, start=False) -> dict:
+        task = self.tasks.get(task_id)
+        if not task:
+            return {"is_ok": False, "reason": f"task {task_id} does not exist"}
+        if task['opening_tomato_id'] > 0:
+            return {"is_ok": False, "reason": "已经有一个番茄在进行中"}
+        with self.lock:
+            tomato_id = next(self.tomato_ids)
+            self.tomatoes[tomato_id] = {"id": tomato_id, "task_id": task_id, "status": "created", "end": None}
+        self.put_task(dict(task, opening_tomato_id=tomato_id))
+        if start:
+            return dict(self.start_tomato(tomato_id), tomato_id=tomato_id)
+        return {"is_ok": True, "tomato_id": tomato_id}
+
+    def start_tomato(self, tomato_id) -> dict:
+        tomato = self.tomatoes.get(tomato_id)
+        if not tomato or tomato['status'] != "created":
+            return {"is_ok": False, "reason": f"tomato {tomato_id} can not start"}
+        task = self.tasks[tomato['task_id']]
+        seconds = self.tomato_seconds if self.tomato_seconds is not None else task['tomato_minute'] * 60
+        start = datetime.datetime.now()
+        end = start + datetime.timedelta(seconds=seconds)
+        tomato.update(status="running", end=end)
+        self.put_task(dict(task, opening_tomato_left_seconds=seconds))
+        return {"is_ok": True, "start": start.strftime(DATETIME_FORMAT), "end": end.strftime(DATETIME_FORMAT), "left_seconds": seconds}
+
+    def abandon_tomato(self, tomato_id) -> dict:
+        tomato = self.tomatoes.get(tomato_id)
+        if not tomato or tomato['status'] not in ("created", "running"):
+            return {"is_ok": False, "reason": f"tomato {tomato_id} can not be abandoned"}
+        tomato['status'] = "abandoned"
+        self.abandon_count += 1
+        task = self.tasks.get(tomato['task_id'])
+        if task:
+            self.put_task(dict(task, opening_tomato_id=-1, opening_tomato_left_seconds=0))
+        return {"is_ok": True, "abandon_count": self.abandon_count}
+
+    def harvest_tomato(self, tomato_id) -> dict:
+        tomato = self.tomatoes.get(tomato_id)
+        if not tomato or tomato['status'] != "running" or tomato['end'] > datetime.datetime.now():
+            return {"is_ok": False, "reason": f"tomato {tomato_id} is not ripe"}
+        tomato['status'] = "harvested"
+        task = self.tasks[tomato['task_id']]
+        task = dict(task, opening_tomato_id=-1, opening_tomato_left_seconds=0, tomato_number=task['tomato_number'] + 1)
+        self.put_task(task)
+        self.user['today_tomato_count'] += 1
+        self.user['left_tomato_number'] += 1
+        return {
+            "is_ok": True,
+            "today_tomato_number": self.user['today_tomato_count'],
+            "task_tomato_number": task['tomato_number'],
+            "user_tomato_number": self.user['left_tomato_number'],
+            "experience": 1,
+            "task_is_done": task['tomato_number'] >= task['expect_tomato_number'],
+        }
+
+    def user_info(self) -> dict:
+        user = {k: v for k, v in self.user.items() if k != 'today_tomato_count'}
+        return {"is_ok": True, "user": user, "today_tomato_count": self.user['today_tomato_count']}
+
+    def get_token(self, username, password) -> dict:
+        if not username or not password:
+            return {"is_ok": False, "reason": "用户名或密码错误"}
+        return {"is_ok": True, "uid": self.user['uid'], "secret": f"stub-{username}"}
+
+
+def make_user() -> dict:
+    return {
+        "uid": 1,
+        "username": "stub",
+        "sex_name": "",
+        "left_tomato_number": 0,
+        "email": "stub@example.com",
+        "upload_header_url": "",
+        "is_vip": False,
+        "today_tomato_count": 0,
+    }
+
+
+def is_datetime(value) -> bool:
+    try:
+        datetime.datetime.strptime(value, DATETIME_FORMAT)
+    except ValueError:
+        return False
+    return True
+
+
+def make_task(task_id) -> dict:
+    return {
+        "id": task_id,
+        "title": f"作业 {task_id}",
+        "status": 1,
+        "tomato_minute": 25,
+        "project": f"项目 {task_id % 7}",
+        "opening_tomato_id": -1,
+        "opening_tomato_left_seconds": 0,
+        "last_update_datetime": now_str(),
+        "tomato_number": 0,
+        "expect_tomato_number": 4,
+        "dead_datetime": (datetime.datetime.now() + datetime.timedelta(days=task_id % 10)).strftime(DATETIME_FORMAT),
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+    # seconds added to every response
+    latency = 0.0
+    # share of requests answered with a 503
+    failure_rate = 0.0
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        handler = self.routes().get(url.path)
+        if handler is None:
+            self.send_json({"is_ok": False, "reason": f"not found {url.path}"}, status=404)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.send_json({"is_ok": False, "reason": "stub failure"}, status=503)
+            return
+        handler(query)
+
+    def routes(self) -> dict:
+        return {
+            "/mobile/task/my/": self.task_my,
+            "/mobile/task/events/": self.task_events,
+            "/mobile/user/info/": lambda query: self.send_json(self.state.user_info()),
+            "/tomato/create/": lambda query: self.tomato(query, lambda: self.state.create_tomato(int(query['task_id']), query.get('start') == '1')),
+            "/tomato/start/": lambda query: self.tomato(query, lambda: self.state.start_tomato(int(query['tomato_id']))),
+            "/tomato/abandon/": lambda query: self.tomato(query, lambda: self.state.abandon_tomato(int(query['tomato_id']))),
+            "/tomato/harvest/": lambda query: self.tomato(query, lambda: self.state.harvest_tomato(int(query['tomato_id']))),
+            "/account/mobile/get_token/": lambda query: self.send_json(self.state.get_token(query.get('username'), query.get('password'))),
+        }
+
+    def tomato(self, query, action):
+        self.send_json(self.state.idempotent(query.get('idempotency_key'), action))
+
+    def task_events(self, query):
+        cursor = int(query['cursor']) if 'cursor' in query else None
+        timeout = min(float(query.get('timeout', 25)), 60)
+        self.send_json(self.state.wait_for_change(cursor, timeout))
+
+    def task_my(self, query):
+        etag = self.state.etag()
+        since = query.get('since', '')
+        # an invalid watermark gets its full_resync even when nothing changed
+        if since and self.state.valid_since(since) and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        data = self.state.list_tasks(since, int(query.get('page', 1)), int(query.get('page_size', 100)))
+        self.send_json(data, headers={'ETag': etag})
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info(format % args)
+
+
+def serve(state: StubState, host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0) -> ThreadingHTTPServer:
+    ''' Start the stub in a daemon thread, port 0 picks a free port '''
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state, "latency": latency, "failure_rate": failure_rate})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="stub-server", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to each response")
+    parser.add_argument("--failure-rate", type=float, default=0, help="share of requests answered with 503")
+    parser.add_argument("--tomato-seconds", type=int, default=None, help="length of a started tomato")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = serve(StubState(args.tasks, args.tomato_seconds), args.host, args.port, args.latency / 1000, args.failure_rate)
+    print(f"serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
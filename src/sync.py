@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+import logging
+import math
+import threading
+
+import settings
+from models import Task, parse_tasks
+from network import decode_json, http_ok
+
+
+logger = logging.getLogger(__name__)
+
+
+class WatermarkRejected(Exception):
+    pass
+
+
+@dataclass
+class SyncResult:
+    tasks: list[Task] = field(default_factory=list)
+    deleted_ids: list[int] = field(default_factory=list)
+    # tasks is the whole list, anything missing from it is gone
+    full: bool = True
+    not_modified: bool = False
+
+
+@dataclass
+class Page:
+    tasks: list[Task] = field(default_factory=list)
+    deleted_ids: list[int] = field(default_factory=list)
+    # None when the server does not report it
+    total: Optional[int] = None
+    is_delta: bool = False
+    watermark: str = ""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+
+
+class TaskSync:
+    ''' Incremental, paginated sync protocol of /mobile/task/my/
+
+    The first fetch is a full one. Afterwards the max `last_update_datetime` seen is
+    sent as `since` together with ETag / If-Modified-Since, and the server answers
+    with 304, or with the changed tasks plus `deleted_ids` tombstones and `is_delta`.
+    A server that rejects the watermark sets `full_resync` and we start over.
+
+    Page 1 tells the `total`, the remaining pages are fetched concurrently by at most
+    `page_workers` threads. Starting a new fetch after `cancel` abandons the old one.
+
+    `client` is an ApiClient.
+    '''
+    PATH = "/mobile/task/my/"
+
+    def __init__(self, client, page_workers=settings.SYNC_PAGE_WORKERS):
+        self.client = client
+        self.pool = ThreadPoolExecutor(max_workers=page_workers, thread_name_prefix="sync-page")
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.watermark = ""
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+
+    def reset(self):
+        with self.lock:
+            self.watermark = ""
+            self.etag = None
+            self.last_modified = None
+
+    def restore(self, watermark, etag=None, last_modified=None):
+        ''' Continue from a watermark saved by an earlier run '''
+        with self.lock:
+            self.watermark = watermark or ""
+            self.etag = etag
+            self.last_modified = last_modified
+
+    def cancel(self) -> int:
+        ''' Abandon the running fetch
+        Returns:
+            the generation of the next fetch
+        '''
+        with self.lock:
+            self.generation += 1
+            return self.generation
+
+    def is_cancelled(self, generation) -> bool:
+        return generation != self.generation
+
+    def fetch(self, page_size=settings.SYNC_PAGE_SIZE, on_page=None) -> Optional[SyncResult]:
+        ''' Runs on the network executor
+
+        `on_page(tasks)` is called from the worker as each page arrives.
+        Returns:
+            None on failure or when cancelled
+        '''
+        generation = self.generation
+        try:
+            return self.collect(generation, page_size, on_page)
+        except WatermarkRejected:
+            logger.info(f"watermark {self.watermark} rejected, full resync")
+            self.reset()
+            return self.collect(generation, page_size, on_page)
+
+    def collect(self, generation, page_size, on_page) -> Optional[SyncResult]:
+        pages: list[Page] = []
+        for page in self.iter_pages(generation, page_size):
+            if page is None or self.is_cancelled(generation):
+                return None
+            if page.not_modified:
+                return SyncResult(full=False, not_modified=True)
+            pages.append(page)
+            if on_page and page.tasks:
+                on_page(page.tasks)
+
+        first = pages[0]
+        tasks = [x for page in pages for x in page.tasks]
+        result = SyncResult(
+            tasks=tasks,
+            deleted_ids=[x for page in pages for x in page.deleted_ids],
+            full=not (self.watermark and first.is_delta),
+        )
+
+        with self.lock:
+            if self.is_cancelled(generation):
+                return None
+            self.etag = first.etag
+            self.last_modified = first.last_modified
+            self.watermark = max([self.watermark] + [x.watermark for x in pages] + [x.last_update_datetime for x in tasks])
+        return result
+
+    def iter_pages(self, generation, page_size) -> Iterator[Optional[Page]]:
+        ''' Page 1, then the others in arrival order, None for a failed page '''
+        first = self.get_page(1, page_size)
+        yield first
+        if first is None or first.not_modified:
+            return
+
+        if first.total is None:
+            # the server does not tell the total, walk until a short page
+            last, number = first, 1
+            while len(last.tasks) >= page_size and not self.is_cancelled(generation):
+                number += 1
+                last = self.get_page(number, page_size)
+                yield last
+                if last is None:
+                    return
+            return
+
+        page_count = math.ceil(first.total / page_size)
+        futures = [self.pool.submit(self.get_page, x, page_size) for x in range(2, page_count + 1)]
+        try:
+            for future in as_completed(futures):
+                if self.is_cancelled(generation):
+                    return
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def get_page(self, page, page_size) -> Optional[Page]:
+        params = {
+            'status': 1,
+            "order": "-id",
+            "page": page,
+            "page_size": page_size,
+        }
+        headers = {}
+        if self.watermark:
+            params['since'] = self.watermark
+            if page == 1 and self.etag:
+                headers['If-None-Match'] = self.etag
+            if page == 1 and self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        r = self.client.request("GET", self.client.pack_url(self.PATH), params=params, headers=headers)
+        if r is None:
+            return None
+        if r.status_code == 304:
+            return Page(not_modified=True)
+        if not http_ok(r):
+            return None
+
+        data = decode_json(r)
+        if data['is_ok'] is False:
+            if data.get('full_resync') and self.watermark:
+                raise WatermarkRejected(data['reason'])
+            self.client.report_error(data['reason'])
+            return None
+
+        return Page(
+            tasks=parse_tasks(data['tasks']),
+            deleted_ids=list(data.get('deleted_ids', [])),
+            total=data.get('total'),
+            is_delta=data.get('is_delta', False),
+            watermark=data.get('watermark') or "",
+            etag=r.headers.get('ETag'),
+            last_modified=r.headers.get('Last-Modified'),
+        )
@@ -0,0 +1,110 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+import json
+import logging
+import sqlite3
+
+from models import Task, parse_tasks
+from task_store import TaskChanges, TaskStore
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheSnapshot:
+    tasks: list[Task] = field(default_factory=list)
+    meta: dict = field(default_factory=dict)
+
+
+class TaskCache:
+    ''' Tasks and sync state of one user kept in sqlite under WORK_DIR
+
+    Changes are collected in memory by `mark_changes` / `set_meta` and written by
+    `flush` in a single transaction on a writer thread, so a crash loses at most
+    the last unflushed batch and never leaves a half written one.
+    '''
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="task-cache")
+        self.rows: dict[int, Optional[str]] = {}
+        self.meta: dict[str, Optional[str]] = {}
+        self.connection: Optional[sqlite3.Connection] = None
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        return self.connection
+
+    def load(self, uid) -> CacheSnapshot:
+        ''' Cached tasks and meta of `uid`, empty when the cache belongs to someone else '''
+        snapshot = CacheSnapshot()
+        try:
+            connection = self.connect()
+            meta = {k: json.loads(v) for k, v in connection.execute("SELECT key, value FROM meta")}
+            if meta.get('uid') != uid:
+                self.clear(uid)
+                return snapshot
+
+            snapshot.tasks = parse_tasks(json.loads(data) for (data,) in connection.execute("SELECT data FROM tasks"))
+            snapshot.meta = meta
+        except (sqlite3.Error, ValueError, TypeError) as e:
+            logger.warning(f"failed to load task cache {self.path}: {e}")
+            self.clear(uid)
+        return snapshot
+
+    def clear(self, uid):
+        self.rows.clear()
+        self.meta.clear()
+        try:
+            connection = self.connect()
+            with connection:
+                connection.execute("DELETE FROM tasks")
+                connection.execute("DELETE FROM meta")
+                connection.execute("INSERT INTO meta (key, value) VALUES ('uid', ?)", (json.dumps(uid),))
+        except sqlite3.Error as e:
+            logger.warning(f"failed to clear task cache {self.path}: {e}")
+
+    def mark_changes(self, changes: TaskChanges, store: TaskStore):
+        for task_id in changes.removed:
+            self.rows[task_id] = None
+        for task_id in changes.added + changes.updated:
+            task = store.get(task_id)
+            if task:
+                self.rows[task_id] = json.dumps(parse_tasks.dump(task), ensure_ascii=False)
+
+    def set_meta(self, key, value):
+        ''' None deletes the key '''
+        self.meta[key] = None if value is None else json.dumps(value, ensure_ascii=False)
+
+    def is_dirty(self) -> bool:
+        return bool(self.rows or self.meta)
+
+    def flush(self) -> Future:
+        rows, self.rows = self.rows, {}
+        meta, self.meta = self.meta, {}
+        return self.writer.submit(self.write, rows, meta)
+
+    def write(self, rows: dict, meta: dict):
+        try:
+            connection = self.connect()
+            with connection:
+                connection.executemany("DELETE FROM tasks WHERE id = ?", [(k,) for k, v in rows.items() if v is None])
+                connection.executemany("INSERT OR REPLACE INTO tasks (id, data) VALUES (?, ?)", [(k, v) for k, v in rows.items() if v is not None])
+                connection.executemany("DELETE FROM meta WHERE key = ?", [(k,) for k, v in meta.items() if v is None])
+                connection.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [(k, v) for k, v in meta.items() if v is not None])
+        except sqlite3.Error as e:
+            logger.warning(f"failed to write task cache {self.path}: {e}")
+
+    def close(self):
+        self.flush()
+        self.writer.shutdown(wait=True)
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,187 @@
+from typing import Iterable, Optional
+import datetime
+import logging
+import time
+
+from models import Task
+from task_store import TaskChanges, TaskStore
+
+
+logger = logging.getLogger(__name__)
+
+# deadline buckets
+OVERDUE = "overdue"
+TODAY = "today"
+THIS_WEEK = "week"
+LATER = "later"
+NO_DEADLINE = "none"
+
+# progress buckets
+NOT_STARTED = "not_started"
+IN_PROGRESS = "in_progress"
+DONE = "done"
+
+# the deadline buckets move with the clock, they are recomputed this often
+DEADLINE_REFRESH_SECONDS = 60
+
+
+def grams(text: str) -> set[str]:
+    ''' Single characters and pairs of neighbours, CJK titles have no words to split at
+
+    >>> sorted(grams("番茄a"))
+    ['a', '番', '番茄', '茄', '茄a']
+    '''
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def deadline_bounds(now: float) -> tuple[float, float]:
+    ''' Epochs of the next midnight and of the monday after this week '''
+    tomorrow = datetime.datetime.fromtimestamp(now).date() + datetime.timedelta(days=1)
+    next_week = tomorrow + datetime.timedelta(days=7 - tomorrow.weekday() if tomorrow.weekday() else 0)
+    return (
+        datetime.datetime.combine(tomorrow, datetime.time()).timestamp(),
+        datetime.datetime.combine(next_week, datetime.time()).timestamp(),
+    )
+
+
+def progress_bucket(task: Task) -> str:
+    if task.expect_tomato_number > 0 and task.tomato_number >= task.expect_tomato_number:
+        return DONE
+    if task.tomato_number <= 0:
+        return NOT_STARTED
+    return IN_PROGRESS
+
+
+class TaskIndex:
+    ''' Search and filter index over the tasks of a TaskStore, kept up to date by its changes
+
+    Titles and projects are split into character grams, a query term looks up
+    the ids holding all of its grams and checks the few candidates for the
+    whole term. Tasks are bucketed by deadline and by progress up front, so
+    a filter is a handful of set intersections however many tasks there are.
+
+    >>> store = TaskStore()
+    >>> index = TaskIndex(store)
+    >>> _ = store.apply([Task(id=1, title="写周报", project="工作"), Task(id=2, title="读书", tomato_number=1, expect_tomato_number=4)])
+    >>> sorted(index.filter("周报")), sorted(index.filter("工作 写")), sorted(index.filter(progress=IN_PROGRESS))
+    ([1], [1], [2])
+    '''
+
+    def __init__(self, store: TaskStore, clock=time.time):
+        self.store = store
+        self.clock = clock
+        self.texts: dict[int, tuple[str, ...]] = {}
+        self.postings: dict[str, set[int]] = {}
+        self.deadlines: dict[str, set[int]] = {}
+        self.progress: dict[str, set[int]] = {}
+        self.buckets: dict[int, tuple[str, str]] = {}
+        self.deadline_checked = 0.0
+        self.bounds = (0.0, 0.0)
+
+        self.refresh_deadlines()
+        self.add(store.tasks)
+        store.subscribe(self.on_tasks_changed)
+
+    def close(self):
+        self.store.unsubscribe(self.on_tasks_changed)
+
+    def on_tasks_changed(self, changes: TaskChanges):
+        for task_id in changes.removed:
+            self.discard(task_id)
+        self.add(changes.added)
+        self.add(changes.updated)
+
+    def add(self, task_ids: Iterable[int]):
+        now = self.deadline_checked
+        for task_id in task_ids:
+            task = self.store.get(task_id)
+            if task is None:
+                continue
+
+            texts = (task.title.casefold(), task.project.casefold())
+            old = self.texts.get(task_id)
+            if old != texts:
+                if old is not None:
+                    self.unpost(task_id, old)
+                self.texts[task_id] = texts
+                for gram in grams(texts[0]) | grams(texts[1]):
+                    self.postings.setdefault(gram, set()).add(task_id)
+
+            buckets = (self.deadline_bucket(task.dead_epoch, now), progress_bucket(task))
+            old_buckets = self.buckets.get(task_id)
+            if old_buckets != buckets:
+                if old_buckets is not None:
+                    self.deadlines[old_buckets[0]].discard(task_id)
+                    self.progress[old_buckets[1]].discard(task_id)
+                self.buckets[task_id] = buckets
+                self.deadlines.setdefault(buckets[0], set()).add(task_id)
+                self.progress.setdefault(buckets[1], set()).add(task_id)
+
+    def discard(self, task_id):
+        texts = self.texts.pop(task_id, None)
+        if texts is not None:
+            self.unpost(task_id, texts)
+        buckets = self.buckets.pop(task_id, None)
+        if buckets is not None:
+            self.deadlines[buckets[0]].discard(task_id)
+            self.progress[buckets[1]].discard(task_id)
+
+    def unpost(self, task_id, texts):
+        for gram in grams(texts[0]) | grams(texts[1]):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(task_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def deadline_bucket(self, dead_epoch, now) -> str:
+        if not dead_epoch:
+            return NO_DEADLINE
+        if dead_epoch < now:
+            return OVERDUE
+        if dead_epoch < self.bounds[0]:
+            return TODAY
+        if dead_epoch < self.bounds[1]:
+            return THIS_WEEK
+        return LATER
+
+    def refresh_deadlines(self):
+        ''' Move the tasks whose deadline bucket changed with the clock '''
+        now = self.clock()
+        if now - self.deadline_checked < DEADLINE_REFRESH_SECONDS:
+            return
+        self.deadline_checked = now
+        self.bounds = deadline_bounds(now)
+        self.deadlines.clear()
+        for task_id, (_, progress) in self.buckets.items():
+            bucket = self.deadline_bucket(self.store.tasks[task_id].dead_epoch, now)
+            self.buckets[task_id] = (bucket, progress)
+            self.deadlines.setdefault(bucket, set()).add(task_id)
+
+    def search(self, term: str) -> set[int]:
+        term = term.casefold()
+        if len(term) <= 2:
+            return set(self.postings.get(term, ()))
+        postings = sorted((self.postings.get(term[i:i + 2], set()) for i in range(len(term) - 1)), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        return {x for x in candidates if term in self.texts[x][0] or term in self.texts[x][1]}
+
+    def filter(self, text="", deadline: Optional[str] = None, progress: Optional[str] = None) -> Optional[set[int]]:
+        ''' Ids of the tasks matching every whitespace separated term of `text` and the buckets, None without any filter '''
+        terms = text.split()
+        if not terms and deadline is None and progress is None:
+            return None
+
+        self.refresh_deadlines()
+        result = None
+        for buckets, name in ((self.deadlines, deadline), (self.progress, progress)):
+            if name is not None:
+                ids = buckets.get(name, set())
+                result = set(ids) if result is None else result & ids
+        # the longest term has the fewest candidates
+        for term in sorted(terms, key=len, reverse=True):
+            if result is not None and not result:
+                break
+            ids = self.search(term)
+            result = ids if result is None else result & ids
+        return result
@@ -0,0 +1,167 @@
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Optional
+import logging
+
+import wx
+
+from base_frame import BaseFrame
+from models import Task
+from task_store import TaskChanges, TaskStore
+
+
+logger = logging.getLogger(__name__)
+
+
+def format_task_label(task: Task, left_seconds) -> str:
+    ''' Row text of `task`, `left_seconds` is what its opening tomato has left '''
+    if task.opening_tomato_id > 0:
+        return f"{task.title}: {task.tomato_number}/{task.expect_tomato_number}🍅 - 开番{BaseFrame.format_seconds(left_seconds)}"
+    return f"{task.title}: {task.tomato_number}/{task.expect_tomato_number}🍅，{task.dead_datetime}截止"
+
+
+@dataclass
+class TaskListDiff:
+    added: list[int] = field(default_factory=list)
+    removed: list[int] = field(default_factory=list)
+    changed: list[int] = field(default_factory=list)
+    reordered: bool = False
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed or self.reordered)
+
+
+class TaskListModel:
+    ''' Rows of the task list keyed by task id, each row holding its rendered label '''
+
+    def __init__(self):
+        self.ids: list[int] = []
+        self.rows: dict[int, int] = {}
+        self.labels: dict[int, str] = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def label(self, row) -> str:
+        if row < 0 or row >= len(self.ids):
+            return ""
+        return self.labels[self.ids[row]]
+
+    def task_id(self, row) -> Optional[int]:
+        if row < 0 or row >= len(self.ids):
+            return None
+        return self.ids[row]
+
+    def row(self, task_id) -> int:
+        return self.rows.get(task_id, -1)
+
+    def update(self, tasks: Iterable[Task], format_label: Callable[[Task], str]) -> TaskListDiff:
+        ids = []
+        labels = {}
+        for task in tasks:
+            ids.append(task.id)
+            labels[task.id] = format_label(task)
+
+        diff = TaskListDiff()
+        for task_id, label in labels.items():
+            old = self.labels.get(task_id)
+            if old is None:
+                diff.added.append(task_id)
+            elif old != label:
+                diff.changed.append(task_id)
+        diff.removed = [x for x in self.ids if x not in labels]
+        diff.reordered = not diff.added and not diff.removed and ids != self.ids
+
+        self.ids = ids
+        self.rows = {x: i for i, x in enumerate(ids)}
+        self.labels = labels
+        return diff
+
+    def update_labels(self, tasks: Iterable[Task], format_label: Callable[[Task], str]) -> TaskListDiff:
+        ''' Relabel rows that already exist and keep their order '''
+        diff = TaskListDiff()
+        for task in tasks:
+            label = format_label(task)
+            if self.labels.get(task.id, label) != label:
+                self.labels[task.id] = label
+                diff.changed.append(task.id)
+        return diff
+
+
+class TaskListCtrl(wx.ListCtrl):
+    ''' Virtual list over a TaskListModel, wx only asks for the labels of visible rows '''
+
+    def __init__(self, parent, title):
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL)
+        self.model = TaskListModel()
+        self.selected_task_id: Optional[int] = None
+
+        self.InsertColumn(0, title)
+        self.Bind(wx.EVT_SIZE, self.on_size)
+        self.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_item_selected)
+        self.Bind(wx.EVT_LIST_ITEM_DESELECTED, self.on_item_deselected)
+
+    def OnGetItemText(self, item, column):
+        return self.model.label(item)
+
+    def on_size(self, event):
+        self.SetColumnWidth(0, self.GetClientSize()[0])
+        event.Skip()
+
+    def on_item_selected(self, event):
+        self.selected_task_id = self.model.task_id(event.GetIndex())
+        event.Skip()
+
+    def on_item_deselected(self, event):
+        self.selected_task_id = None
+        event.Skip()
+
+    def get_selected_task_id(self) -> Optional[int]:
+        return self.selected_task_id
+
+    def set_tasks(self, tasks: Iterable[Task], format_label: Callable[[Task], str]) -> TaskListDiff:
+        diff = self.model.update(tasks, format_label)
+        if diff.is_empty():
+            return diff
+
+        if diff.added or diff.removed or diff.reordered:
+            self.SetItemCount(len(self.model))
+            self.restore_selection()
+            self.refresh_visible()
+        else:
+            for task_id in diff.changed:
+                self.RefreshItem(self.model.row(task_id))
+        return diff
+
+    def apply_changes(self, changes: TaskChanges, store: TaskStore, format_label: Callable[[Task], str]) -> TaskListDiff:
+        ''' Relabel only the updated tasks unless rows were added, removed or moved '''
+        if changes.reordered:
+            return self.set_tasks(store, format_label)
+
+        return self.refresh_labels((store.get(x) for x in changes.updated), format_label)
+
+    def refresh_labels(self, tasks: Iterable[Task], format_label: Callable[[Task], str]) -> TaskListDiff:
+        ''' Redraw the rows of `tasks` whose label changed '''
+        diff = self.model.update_labels(tasks, format_label)
+        for task_id in diff.changed:
+            self.RefreshItem(self.model.row(task_id))
+        return diff
+
+    def restore_selection(self):
+        ''' Keep the selected task selected after rows moved '''
+        task_id = self.selected_task_id
+        row = self.model.row(task_id) if task_id is not None else -1
+        selected = self.GetFirstSelected()
+        if selected != row:
+            if selected >= 0:
+                self.Select(selected, on=False)
+            if row >= 0:
+                self.Select(row)
+        self.selected_task_id = task_id if row >= 0 else None
+
+    def refresh_visible(self):
+        if not len(self.model):
+            self.Refresh()
+            return
+        top = self.GetTopItem()
+        bottom = min(top + self.GetCountPerPage(), len(self.model) - 1)
+        self.RefreshItems(top, bottom)
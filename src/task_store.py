@@ -0,0 +1,136 @@
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Optional
+import logging
+
+from models import Task
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TaskChanges:
+    added: list[int] = field(default_factory=list)
+    updated: list[int] = field(default_factory=list)
+    removed: list[int] = field(default_factory=list)
+    # the order of the tasks changed
+    reordered: bool = False
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.updated or self.removed)
+
+
+class TaskStore:
+    ''' Tasks indexed by id, kept ordered by last_update_epoch, newest first
+
+    Tasks with an opening tomato are indexed too. Listeners subscribed with
+    `subscribe` get one TaskChanges per modification.
+    '''
+
+    def __init__(self):
+        self.tasks: dict[int, Task] = {}
+        self.keys: dict[int, tuple] = {}
+        self.order: list[tuple] = []
+        self.opening_ids: set[int] = set()
+        self.listeners: list[Callable[[TaskChanges], None]] = []
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def __contains__(self, task_id):
+        return task_id in self.tasks
+
+    def __iter__(self) -> Iterator[Task]:
+        for key in self.order:
+            yield self.tasks[-key[1]]
+
+    def get(self, task_id) -> Optional[Task]:
+        return self.tasks.get(task_id)
+
+    def opening_task(self) -> Optional[Task]:
+        ''' The most recently updated task with an opening tomato '''
+        if not self.opening_ids:
+            return None
+        return self.tasks[-min(self.keys[x] for x in self.opening_ids)[1]]
+
+    def subscribe(self, listener: Callable[[TaskChanges], None]):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def notify(self, changes: TaskChanges):
+        if changes.is_empty():
+            return
+        for listener in list(self.listeners):
+            listener(changes)
+
+    def apply(self, tasks: Iterable[Task] = (), deleted_ids: Iterable[int] = (), full=False) -> TaskChanges:
+        ''' Put `tasks`, drop `deleted_ids`, a `full` list also drops every task it does not contain '''
+        tasks = list(tasks)
+        changes = TaskChanges()
+        if full:
+            keep = {x.id for x in tasks}
+            deleted_ids = [x for x in self.tasks if x not in keep]
+        for task_id in deleted_ids:
+            if self.discard(task_id):
+                changes.removed.append(task_id)
+                changes.reordered = True
+        for task in tasks:
+            self.index(task, changes)
+        self.notify(changes)
+        return changes
+
+    def put(self, task: Task) -> TaskChanges:
+        return self.apply([task])
+
+    def remove(self, task_id) -> TaskChanges:
+        return self.apply(deleted_ids=[task_id])
+
+    def update(self, task_id, **fields) -> TaskChanges:
+        ''' Change fields of a stored task in place '''
+        task = self.tasks.get(task_id)
+        changes = TaskChanges()
+        if task is None:
+            return changes
+        for name, value in fields.items():
+            setattr(task, name, value)
+        task.refresh()
+        self.index(task, changes)
+        self.notify(changes)
+        return changes
+
+    def index(self, task: Task, changes: TaskChanges):
+        key = (-task.last_update_epoch, -task.id)
+        old_key = self.keys.get(task.id)
+        old = self.tasks.get(task.id)
+        if old is not task and old == task:
+            # unchanged, keep the stored task and its formatted label
+            return
+        if old_key is None:
+            changes.added.append(task.id)
+            changes.reordered = True
+        else:
+            changes.updated.append(task.id)
+        if old_key != key:
+            if old_key is not None:
+                del self.order[bisect_left(self.order, old_key)]
+                changes.reordered = True
+            insort(self.order, key)
+            self.keys[task.id] = key
+
+        self.tasks[task.id] = task
+        if task.opening_tomato_id > 0:
+            self.opening_ids.add(task.id)
+        else:
+            self.opening_ids.discard(task.id)
+
+    def discard(self, task_id) -> bool:
+        key = self.keys.pop(task_id, None)
+        if key is None:
+            return False
+        del self.order[bisect_left(self.order, key)]
+        del self.tasks[task_id]
+        self.opening_ids.discard(task_id)
+        return True
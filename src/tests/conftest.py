@@ -0,0 +1,68 @@
+from pathlib import Path
+import sys
+import time
+
+import pytest
+
+# the modules are flat in src/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import settings
+from client import ApiClient
+from credentials import Credentials
+from daemon import EventLoop
+from engine import Engine
+from stub_server import StubState, serve
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    ''' Nothing is written to the real WORK_DIR, and no push channel is started '''
+    monkeypatch.setattr(settings, "TOKEN_PATH", tmp_path / "token.json")
+    monkeypatch.setattr(settings, "CACHE_PATH", tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(settings, "JOURNAL_PATH", tmp_path / "journal.jsonl")
+    monkeypatch.setattr(settings, "PUSH_ENABLED", False)
+    return tmp_path
+
+
+@pytest.fixture
+def state():
+    return StubState(10, tomato_seconds=60)
+
+
+@pytest.fixture
+def server(state):
+    server = serve(state)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(server, state):
+    host, port = server.server_address[:2]
+    token = state.get_token("test", "test")
+    return ApiClient(f"http://{host}:{port}", Credentials(uid=token['uid'], token=token['secret']))
+
+
+@pytest.fixture
+def loop():
+    return EventLoop()
+
+
+@pytest.fixture
+def engine(client, loop):
+    engine = Engine(client, loop.scheduler, loop.post)
+    yield engine
+    engine.close()
+
+
+@pytest.fixture
+def pump(loop):
+    ''' Run the loop until `done()` is true, fail after `timeout` seconds '''
+    def pump(done, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not done():
+            assert time.monotonic() < deadline, "timed out"
+            loop.run_once(timeout=0.02)
+    return pump
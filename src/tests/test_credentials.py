@@ -0,0 +1,53 @@
+import json
+import os
+
+import pytest
+
+import settings
+from credentials import Credentials
+
+
+def test_save_replaces_the_token_file(tmp_path):
+    path = tmp_path / "token.json"
+    credentials = Credentials(path)
+    params = credentials.params()
+    credentials.save({'uid': 7, 'secret': "s"})
+
+    assert json.loads(path.read_text()) == {'uid': 7, 'secret': "s"}
+    assert not path.with_suffix(".tmp").exists()
+    assert credentials.params()['uid'] == 7
+    # handed out params are never changed
+    assert params['uid'] == -1
+
+
+def test_failed_save_keeps_the_old_token(tmp_path):
+    path = tmp_path / "token.json"
+    Credentials(path).save({'uid': 7, 'secret': "s"})
+    with pytest.raises(TypeError):
+        Credentials(path).save({'uid': 8, 'secret': object()})
+    assert Credentials(path).uid == 7
+
+
+def test_login_of_another_process_is_picked_up(tmp_path, monkeypatch):
+    path = tmp_path / "token.json"
+    Credentials(path).save({'uid': 7, 'secret': "s"})
+    credentials = Credentials(path)
+
+    Credentials(path).save({'uid': 8, 'secret': "t"})
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    # not stat'ed again before TOKEN_CHECK_SECONDS
+    assert credentials.params()['uid'] == 7
+
+    monkeypatch.setattr(settings, "TOKEN_CHECK_SECONDS", 0)
+    assert credentials.params()['uid'] == 8
+
+
+def test_broken_token_file_keeps_the_token(tmp_path, monkeypatch):
+    path = tmp_path / "token.json"
+    Credentials(path).save({'uid': 7, 'secret': "s"})
+    credentials = Credentials(path)
+
+    path.write_text('{"uid": 8')
+    monkeypatch.setattr(settings, "TOKEN_CHECK_SECONDS", 0)
+    assert credentials.params()['uid'] == 7
@@ -0,0 +1,108 @@
+import time
+
+from engine import EngineListener
+from tomato import TomatoState
+
+
+def start(engine, pump, task_id=5):
+    engine.start()
+    pump(lambda: engine.find_task(task_id) and not engine.syncing)
+    return engine.find_task(task_id)
+
+
+def test_sync_read_before_a_click_does_not_undo_it(engine, pump, state):
+    task = start(engine, pump)
+    # so the delta carries the task
+    state.put_task(dict(state.tasks[task.id], title="renamed"))
+    assert engine.sync_tasks(sync_interval_seconds=0)
+    # the fetch finishes and queues its result, still without the tomato
+    time.sleep(0.5)
+
+    assert engine.toggle_tomato(task) == 'start'
+    pump(lambda: not len(engine.journal) and not engine.replaying and not engine.syncing)
+
+    task = engine.find_task(task.id)
+    assert engine.tomato_state(task) is TomatoState.RUNNING
+    assert engine.lock_listen_task_id == task.id
+    assert task.opening_tomato_id == state.tasks[task.id]['opening_tomato_id'] > 0
+
+
+class Recorder(EngineListener):
+    def __init__(self):
+        self.due = []
+        self.tips = []
+
+    def on_lock_due(self, task):
+        self.due.append(task.id)
+
+    def on_tips(self, msg):
+        self.tips.append(msg)
+
+
+def test_tomato_runs_to_the_harvest(engine, pump, state):
+    state.tomato_seconds = 2
+    recorder = Recorder()
+    engine.subscribe(recorder)
+    task = start(engine, pump)
+
+    assert engine.toggle_tomato(task) == 'start'
+    assert engine.tomato_state(task) is TomatoState.RUNNING
+    assert engine.lock_left_seconds() == task.tomato_minute * 60
+    # the server's 2 seconds move the optimistic lock
+    pump(lambda: not len(engine.journal) and not engine.replaying)
+    assert engine.lock_left_seconds() <= 2
+    tomato_id = task.opening_tomato_id
+    assert state.tomatoes[tomato_id]['status'] == "running"
+
+    pump(lambda: recorder.due)
+    assert recorder.due == [task.id]
+    assert engine.tomato_state(task) is TomatoState.DONE
+    assert engine.lock_listen_task_id == 0
+
+    assert engine.toggle_tomato(task) == 'harvest'
+    pump(lambda: not len(engine.journal) and not engine.replaying and recorder.tips)
+    assert state.tomatoes[tomato_id]['status'] == "harvested"
+    task = engine.find_task(task.id)
+    assert engine.tomato_state(task) is TomatoState.IDLE
+    assert task.tomato_number == state.tasks[task.id]['tomato_number'] == 1
+    assert "收割成功" in recorder.tips[0]
+
+
+def test_abandon_a_running_tomato(engine, pump, state):
+    recorder = Recorder()
+    engine.subscribe(recorder)
+    task = start(engine, pump)
+    engine.toggle_tomato(task)
+    pump(lambda: not len(engine.journal) and not engine.replaying)
+    tomato_id = task.opening_tomato_id
+
+    assert engine.toggle_tomato(task) == 'abandon'
+    assert engine.tomato_state(task) is TomatoState.IDLE
+    assert engine.lock_listen_task_id == 0
+    pump(lambda: not len(engine.journal) and not engine.replaying and recorder.tips)
+    assert state.tomatoes[tomato_id]['status'] == "abandoned"
+    assert state.tasks[task.id]['opening_tomato_id'] == -1
+    assert recorder.due == []
+
+
+def test_abandon_before_the_server_answered(engine, pump, state):
+    task = start(engine, pump)
+    engine.toggle_tomato(task)
+    # both clicks are journaled before the replay sends anything
+    assert engine.toggle_tomato(task) == 'abandon'
+    pump(lambda: not len(engine.journal) and not engine.replaying and not engine.syncing)
+
+    assert engine.tomato_state(engine.find_task(task.id)) is TomatoState.IDLE
+    assert [x['status'] for x in state.tomatoes.values()] == ["abandoned"]
+
+
+def test_push_change_during_the_replay_syncs_after_it(engine, pump, server, monkeypatch):
+    task = start(engine, pump)
+    synced = engine.last_sync_task_time
+    monkeypatch.setattr(server.RequestHandlerClass, "latency", 0.3)
+    engine.toggle_tomato(task)
+
+    engine.on_push_change()
+    assert not engine.syncing and engine.sync_again and engine.sync_again_while_locked
+    pump(lambda: engine.last_sync_task_time != synced and not engine.syncing)
+    assert not len(engine.journal)
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+import time
+
+import settings
+from journal import Journal, is_local_tomato_id
+from tomato import TomatoState
+
+
+def test_replay_resolves_local_ids_in_order(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    local_id = journal.new_local_tomato_id()
+    journal.append('create', 7, local_tomato_id=local_id)
+    journal.append('start', 7, tomato_id=local_id)
+    sent = []
+
+    def send(entry, tomato_id):
+        sent.append((entry['action'], tomato_id))
+        if entry['action'] == 'create':
+            return {'is_ok': True, 'tomato_id': 42}
+        return {'is_ok': True, 'left_seconds': 60}
+
+    done = journal.replay(send)
+    assert sent == [('create', 0), ('start', 42)]
+    assert [entry['action'] for entry, _ in done] == ['create', 'start']
+    assert not len(journal)
+    assert is_local_tomato_id(local_id)
+
+
+def test_local_id_stays_resolved_after_compaction(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    local_id = journal.new_local_tomato_id()
+    journal.append('create', 7, local_tomato_id=local_id)
+    journal.replay(lambda entry, tomato_id: {'is_ok': True, 'tomato_id': 42})
+    assert not len(journal)
+
+    # the task still shows the local id when it is abandoned
+    journal.append('abandon', 7, tomato_id=local_id)
+    sent = []
+    journal.replay(lambda entry, tomato_id: sent.append(tomato_id) or {'is_ok': True, 'abandon_count': 1})
+    assert sent == [42]
+    # and after a restart
+    assert Journal(tmp_path / "journal.jsonl").tomato_id({'tomato_id': local_id}) == 42
+
+
+def test_expired_local_ids_are_dropped_on_compaction(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl", keep_resolved=10)
+    local_id = journal.new_local_tomato_id()
+    entry = journal.append('create', 7, local_tomato_id=local_id)
+    entry['created'] = time.time() - 100
+    journal.replay(lambda entry, tomato_id: {'is_ok': True, 'tomato_id': 42})
+    assert journal.tomato_id({'tomato_id': local_id}) is None
+    assert Journal(tmp_path / "journal.jsonl").tomato_id({'tomato_id': local_id}) is None
+
+
+def test_unreachable_server_keeps_the_entries(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.append('abandon', 7, tomato_id=3)
+    assert journal.replay(lambda entry, tomato_id: None) == []
+    # written before it is sent, a restart replays it
+    assert len(Journal(tmp_path / "journal.jsonl")) == 1
+
+
+def test_server_errors_give_up_after_max_attempts(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    journal.append('harvest', 7, tomato_id=3)
+    journal.append('abandon', 8, tomato_id=4)
+    failing = lambda entry, tomato_id: {'is_ok': False, 'retry': True, 'reason': "status code 503"}
+    for _ in range(2):
+        assert journal.replay(failing, max_attempts=3) == []
+    done = journal.replay(failing, max_attempts=3)
+    # the stuck entry is closed as failed, the next one is not held up by it
+    assert [entry['action'] for entry, _ in done] == ['harvest']
+    assert not done[0][1]['is_ok']
+    assert len(journal) == 1
+
+
+def test_old_entries_are_given_up_unsent(tmp_path):
+    journal = Journal(tmp_path / "journal.jsonl")
+    entry = journal.append('harvest', 7, tomato_id=3)
+    entry['created'] = time.time() - 100
+    done = journal.replay(never_send, max_age=10)
+    assert [(entry['action'], result['is_ok']) for entry, result in done] == [('harvest', False)]
+
+
+def never_send(entry, tomato_id):
+    raise AssertionError("an expired entry was sent")
+
+
+def test_failing_action_does_not_block_the_sync(engine, pump, server, monkeypatch):
+    monkeypatch.setattr(settings, "JOURNAL_RETRY_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "JOURNAL_MAX_ATTEMPTS", 3)
+    engine.start()
+    pump(lambda: engine.find_task(5) and not engine.syncing)
+
+    synced = engine.last_sync_task_time
+    monkeypatch.setattr(server.RequestHandlerClass, "failure_rate", 1.0)
+    engine.toggle_tomato(engine.find_task(5))
+    pump(lambda: not len(engine.journal) and not engine.replaying)
+    monkeypatch.setattr(server.RequestHandlerClass, "failure_rate", 0.0)
+
+    # the create was given up, the tomato rolled back and a reconcile sync asked for
+    task = engine.find_task(5)
+    assert engine.tomato_state(task) is TomatoState.IDLE
+    assert engine.lock_listen_task_id == 0
+    pump(lambda: engine.last_sync_task_time != synced and not engine.syncing)
+
+
+def test_same_key_same_response(client, state):
+    first = client.create_tomato(5, "key-1", start=True)
+    # the response was lost, the replay sends the entry again
+    assert client.create_tomato(5, "key-1", start=True) == first
+    assert list(state.tomatoes) == [first['tomato_id']]
+    assert client.create_tomato(5, "key-2")['is_ok'] is False
+
+
+def test_replay_after_a_lost_response_does_not_repeat_the_action(tmp_path, client, state):
+    journal = Journal(tmp_path / "journal.jsonl")
+    entry = journal.append('create', 5, local_tomato_id=journal.new_local_tomato_id())
+    client.create_tomato(5, entry['key'])
+
+    done = journal.replay(lambda entry, tomato_id: client.create_tomato(entry['task_id'], entry['key']))
+    assert done[0][1]['is_ok']
+    assert len(state.tomatoes) == 1
+
+
+def test_abandon_right_after_the_create_drained(engine, pump, state):
+    engine.start()
+    pump(lambda: engine.find_task(5) and not engine.syncing)
+    task = engine.find_task(5)
+    engine.toggle_tomato(task)
+    local_id = task.opening_tomato_id
+    # the worker drained the journal, its result is not applied to the task yet
+    deadline = time.monotonic() + 5
+    while len(engine.journal):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert task.opening_tomato_id == local_id
+
+    assert engine.toggle_tomato(task) == 'abandon'
+    pump(lambda: not len(engine.journal) and not engine.replaying and not engine.syncing)
+    assert [x['status'] for x in state.tomatoes.values()] == ["abandoned"]
+    assert engine.tomato_state(engine.find_task(5)) is TomatoState.IDLE
+
+
+def test_error_body_without_is_ok_is_retried(client, monkeypatch):
+    # a framework 404 or a proxy error in json, not an answer of the api
+    response = SimpleNamespace(status_code=404, content=b'{"detail": "Not found."}')
+    monkeypatch.setattr(client, "request", lambda *args, **kwargs: response)
+    result = client.abandon_tomato(3, "key")
+    assert result['retry'] and result['is_ok'] is False
+
+    response.content = b'["not", "a", "dict"]'
+    assert client.harvest_tomato(3, "key")['retry']
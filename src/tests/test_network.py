@@ -0,0 +1,12 @@
+from types import SimpleNamespace
+
+from network import http_ok
+
+
+def test_http_ok_does_not_rely_on_truthiness():
+    # like an httpx response: always truthy, whatever the status
+    assert http_ok(SimpleNamespace(status_code=200))
+    assert http_ok(SimpleNamespace(status_code=304))
+    assert not http_ok(SimpleNamespace(status_code=404))
+    assert not http_ok(SimpleNamespace(status_code=503))
+    assert not http_ok(None)
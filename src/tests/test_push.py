@@ -0,0 +1,61 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import settings
+from client import ApiClient
+from credentials import Credentials
+from push import PushChannel
+
+
+def test_change_wakes_the_channel(client, state):
+    changed = threading.Event()
+    channel = PushChannel(client, on_change=changed.set, on_state=lambda connected: None, timeout=5)
+    channel.start()
+    try:
+        # the first request only learns the cursor
+        for _ in range(100):
+            if channel.cursor is not None:
+                break
+            channel.stopped.wait(0.05)
+        state.put_task(dict(state.tasks[1], title="renamed"))
+        assert changed.wait(5)
+        assert channel.connected
+    finally:
+        channel.stop()
+
+
+class PortalHandler(BaseHTTPRequestHandler):
+    ''' Answers every request with a 200 html page '''
+
+    def do_GET(self):
+        body = b"<html>login to the wifi</html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_broken_response_backs_off_and_keeps_running(monkeypatch):
+    monkeypatch.setattr(settings, "PUSH_RETRY_MAX_SECONDS", 0.05)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PortalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    client = ApiClient(f"http://{host}:{port}", Credentials(uid=1, token="x"))
+    states = []
+    channel = PushChannel(client, on_change=lambda: None, on_state=states.append, timeout=1)
+    channel.connected = True
+    channel.start()
+    try:
+        channel.stopped.wait(0.3)
+        assert channel.thread.is_alive()
+        assert not channel.connected
+    finally:
+        channel.stop()
+        channel.thread.join(5)
+        server.shutdown()
+        server.server_close()
+    assert not channel.connected
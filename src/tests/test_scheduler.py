@@ -0,0 +1,67 @@
+from scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_scheduler():
+    clock, armed = Clock(), []
+    return Scheduler(armed.append, clock=clock), clock, armed
+
+
+def test_due_calls_run_in_deadline_order():
+    scheduler, clock, armed = make_scheduler()
+    calls = []
+    scheduler.call_later(2, calls.append, "b")
+    scheduler.call_later(1, calls.append, "a")
+    scheduler.call_later(2, calls.append, "c")
+    scheduler.call_later(5, calls.append, "d")
+    # only the nearest deadline is armed
+    assert armed == [2, 1]
+
+    clock.now += 2
+    scheduler.run_due()
+    # same deadline, first scheduled first
+    assert calls == ["a", "b", "c"]
+    assert armed[-1] == 3
+
+
+def test_cancel_rearms_the_next_deadline():
+    scheduler, clock, armed = make_scheduler()
+    calls = []
+    first = scheduler.call_later(1, calls.append, "a")
+    scheduler.call_later(3, calls.append, "b")
+    scheduler.cancel(first)
+    assert armed[-1] == 3
+    scheduler.cancel(first)
+
+    clock.now += 3
+    scheduler.run_due()
+    assert calls == ["b"]
+    assert armed[-1] is None
+
+
+def test_failing_call_does_not_stop_the_others():
+    scheduler, clock, armed = make_scheduler()
+    calls = []
+    scheduler.call_later(1, lambda: 1 / 0)
+    scheduler.call_later(1, calls.append, "a")
+    clock.now += 1
+    scheduler.run_due()
+    assert calls == ["a"]
+
+
+def test_call_scheduled_while_running_waits_for_the_next_run():
+    scheduler, clock, armed = make_scheduler()
+    calls = []
+    scheduler.call_later(0, lambda: scheduler.call_later(1, calls.append, "later"))
+    scheduler.run_due()
+    assert calls == [] and armed[-1] == 1
+    clock.now += 1
+    scheduler.run_due()
+    assert calls == ["later"]
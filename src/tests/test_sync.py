@@ -0,0 +1,81 @@
+import time
+
+from sync import TaskSync
+
+
+def test_first_fetch_is_full_then_not_modified(client, state):
+    sync = TaskSync(client)
+    result = sync.fetch()
+    assert result.full and not result.not_modified
+    assert sorted(x.id for x in result.tasks) == list(range(1, 11))
+    assert sync.etag == state.etag()
+
+    result = sync.fetch()
+    assert result.not_modified and not result.tasks
+
+
+def test_delta_carries_changes_and_tombstones(client, state):
+    sync = TaskSync(client)
+    sync.fetch()
+    state.put_task(dict(state.tasks[5], title="renamed"))
+    state.remove_task(3)
+
+    result = sync.fetch()
+    assert not result.full and not result.not_modified
+    # tasks updated in the same second as the watermark come again
+    assert {x.id: x.title for x in result.tasks}[5] == "renamed"
+    assert 3 not in {x.id for x in result.tasks}
+    assert result.deleted_ids == [3]
+
+
+def test_pages_are_collected(client, state):
+    sync = TaskSync(client)
+    pages = []
+    result = sync.fetch(page_size=3, on_page=pages.append)
+    assert len(pages) == 4
+    assert sorted(x.id for x in result.tasks) == list(range(1, 11))
+
+
+def test_watermark_before_the_tombstones_resyncs(client, state):
+    sync = TaskSync(client)
+    sync.restore("2000-01-01 00:00:00")
+    result = sync.fetch()
+    assert result.full
+    assert sorted(x.id for x in result.tasks) == list(range(1, 11))
+
+
+def test_expired_tombstones_force_a_full_resync(client, state):
+    sync = TaskSync(client)
+    sync.fetch()
+    state.remove_task(3)
+    # the horizon has to pass the watermark, datetimes have whole seconds
+    time.sleep(1.1)
+    state.forget_tombstones()
+
+    result = sync.fetch()
+    assert result.full
+    assert sorted(x.id for x in result.tasks) == [1, 2, 4, 5, 6, 7, 8, 9, 10]
+
+
+def test_invalid_watermark_with_a_current_etag_resyncs(client, state):
+    sync = TaskSync(client)
+    assert len(sync.fetch().tasks) == 10
+
+    # nothing changed since, the etag alone would answer 304
+    sync.restore("not a datetime", etag=sync.etag)
+    result = sync.fetch()
+    assert result.full and not result.not_modified
+    assert sorted(x.id for x in result.tasks) == list(range(1, 11))
+    assert sync.watermark == max(x['last_update_datetime'] for x in state.tasks.values())
+
+
+def test_cancelled_fetch_keeps_the_watermark(client, state):
+    sync = TaskSync(client)
+    pages = []
+
+    def cancel(tasks):
+        pages.append(tasks)
+        sync.cancel()
+
+    assert sync.fetch(on_page=cancel) is None
+    assert pages and sync.watermark == "" and sync.etag is None
@@ -0,0 +1,68 @@
+import time
+
+import settings
+from models import Task
+from task_cache import TaskCache
+from task_store import TaskStore
+
+
+def make_cache(tmp_path, uid, tasks, **meta):
+    cache = TaskCache(tmp_path / "cache.sqlite3")
+    cache.load(uid)
+    store = TaskStore()
+    cache.mark_changes(store.apply(tasks), store)
+    cache.set_meta('uid', uid)
+    for key, value in meta.items():
+        cache.set_meta(key, value)
+    cache.close()
+
+
+def test_tasks_and_meta_come_back(tmp_path):
+    make_cache(tmp_path, 1, [Task(id=1, title="写周报"), Task(id=2)], watermark="2024-01-01 10:00:00")
+    snapshot = TaskCache(tmp_path / "cache.sqlite3").load(1)
+    assert sorted((x.id, x.title) for x in snapshot.tasks) == [(1, "写周报"), (2, "")]
+    assert snapshot.meta['watermark'] == "2024-01-01 10:00:00"
+
+
+def test_another_user_wipes_the_cache(tmp_path):
+    make_cache(tmp_path, 1, [Task(id=1)], watermark="2024-01-01 10:00:00")
+    assert TaskCache(tmp_path / "cache.sqlite3").load(2).tasks == []
+    # wiped, not only hidden
+    snapshot = TaskCache(tmp_path / "cache.sqlite3").load(1)
+    assert snapshot.tasks == [] and snapshot.meta == {}
+
+
+def test_unflushed_changes_are_lost_whole(tmp_path):
+    cache = TaskCache(tmp_path / "cache.sqlite3")
+    cache.load(1)
+    store = TaskStore()
+    cache.mark_changes(store.apply([Task(id=1), Task(id=2)]), store)
+    cache.flush().result()
+    # crash before the next flush
+    cache.mark_changes(store.remove(1), store)
+    assert cache.is_dirty()
+
+    assert sorted(x.id for x in TaskCache(tmp_path / "cache.sqlite3").load(1).tasks) == [1, 2]
+
+
+def test_failed_flush_writes_nothing_of_its_batch(tmp_path):
+    cache = TaskCache(tmp_path / "cache.sqlite3")
+    cache.load(1)
+    store = TaskStore()
+    cache.mark_changes(store.apply([Task(id=1)]), store)
+    # sqlite can not bind it, the batch is rolled back after the task row went in
+    cache.meta['broken'] = object()
+    cache.flush().result()
+    cache.close()
+
+    assert TaskCache(tmp_path / "cache.sqlite3").load(1).tasks == []
+
+
+def test_running_tomato_counts_down_from_its_saved_end(tmp_path, engine):
+    tasks = [Task(id=1, opening_tomato_id=7, opening_tomato_left_seconds=1500), Task(id=2, opening_tomato_id=8, opening_tomato_left_seconds=1500)]
+    make_cache(settings.CACHE_PATH.parent, engine.client.uid, tasks, tomato={'task_id': 1, 'tomato_id': 7, 'end': time.time() + 100})
+    engine.load_cache()
+
+    assert 98 <= engine.find_task(1).opening_tomato_left_seconds <= 100
+    # no saved end, the stored seconds are stale
+    assert engine.find_task(2).opening_tomato_left_seconds == 0
@@ -0,0 +1,55 @@
+from models import Task
+from task_store import TaskStore
+
+
+def make_task(task_id, minute, **fields):
+    return Task(id=task_id, title=f"task {task_id}", last_update_datetime=f"2024-01-01 10:{minute:02d}:00", **fields)
+
+
+def test_tasks_are_ordered_newest_first():
+    store = TaskStore()
+    changes = store.apply([make_task(1, 5), make_task(2, 7), make_task(3, 7)])
+    assert sorted(changes.added) == [1, 2, 3] and changes.reordered
+    # same time, the higher id first
+    assert [x.id for x in store] == [3, 2, 1]
+
+    changes = store.update(1, last_update_datetime="2024-01-01 10:09:00")
+    assert changes.updated == [1] and changes.reordered
+    assert [x.id for x in store] == [1, 3, 2]
+
+
+def test_full_apply_drops_what_it_does_not_contain():
+    store = TaskStore()
+    store.apply([make_task(1, 5), make_task(2, 6), make_task(3, 7)])
+    changes = store.apply([make_task(1, 5), make_task(3, 8)], full=True)
+    assert changes.removed == [2]
+    # task 1 is unchanged
+    assert changes.updated == [3] and not changes.added
+    assert [x.id for x in store] == [3, 1]
+
+    assert store.remove(3).removed == [3]
+    assert 3 not in store and len(store) == 1
+
+
+def test_listeners_get_one_change_per_modification():
+    store = TaskStore()
+    seen = []
+    store.subscribe(seen.append)
+    store.apply([make_task(1, 5)])
+    store.put(make_task(1, 5))
+    store.update(7, title="missing")
+    store.update(1, title="renamed")
+    store.unsubscribe(seen.append)
+    store.remove(1)
+    assert [(x.added, x.updated, x.removed) for x in seen] == [([1], [], []), ([], [1], [])]
+
+
+def test_opening_task_is_the_newest_with_a_tomato():
+    store = TaskStore()
+    store.apply([make_task(1, 5, opening_tomato_id=11), make_task(2, 6), make_task(3, 4, opening_tomato_id=12)])
+    assert store.opening_task().id == 1
+
+    store.update(1, opening_tomato_id=-1)
+    assert store.opening_task().id == 3
+    store.remove(3)
+    assert store.opening_task() is None
@@ -0,0 +1,54 @@
+from enum import Enum
+
+from models import Task
+
+
+class TomatoState(Enum):
+    IDLE = "idle"
+    CREATED = "created"
+    RUNNING = "running"
+    DONE = "done"
+    ABANDONED = "abandoned"
+    HARVESTED = "harvested"
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+# (state, event) -> state. ABANDONED and HARVESTED end a tomato, the task is
+# IDLE again for the next one. `reject` and `stall` undo an optimistic create
+# or start the server refused.
+TRANSITIONS = {
+    (TomatoState.IDLE, 'create'): TomatoState.CREATED,
+    (TomatoState.CREATED, 'start'): TomatoState.RUNNING,
+    (TomatoState.RUNNING, 'ripen'): TomatoState.DONE,
+    (TomatoState.CREATED, 'abandon'): TomatoState.ABANDONED,
+    (TomatoState.RUNNING, 'abandon'): TomatoState.ABANDONED,
+    (TomatoState.DONE, 'harvest'): TomatoState.HARVESTED,
+    (TomatoState.CREATED, 'reject'): TomatoState.IDLE,
+    (TomatoState.RUNNING, 'reject'): TomatoState.IDLE,
+    (TomatoState.RUNNING, 'stall'): TomatoState.CREATED,
+}
+
+
+def transition(state: TomatoState, event: str) -> TomatoState:
+    '''
+    >>> transition(TomatoState.IDLE, 'create')
+    <TomatoState.CREATED: 'created'>
+    >>> (TomatoState.IDLE, 'harvest') in TRANSITIONS
+    False
+    '''
+    try:
+        return TRANSITIONS[state, event]
+    except KeyError:
+        raise InvalidTransition(f"can not {event} the {state.value} tomato") from None
+
+
+def task_state(task: Task) -> TomatoState:
+    ''' The state the task fields tell, a CREATED tomato looks DONE in them '''
+    if task.opening_tomato_id <= 0:
+        return TomatoState.IDLE
+    if task.opening_tomato_left_seconds > 0:
+        return TomatoState.RUNNING
+    return TomatoState.DONE
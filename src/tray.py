@@ -0,0 +1,60 @@
+import wx
+from wx.adv import TBI_DEFAULT_TYPE, TaskBarIcon
+
+import settings
+from metrics import metrics
+
+
+class MyTaskBarIcon(TaskBarIcon):
+
+    def __init__(self, frame):
+        super().__init__(iconType=TBI_DEFAULT_TYPE)
+        self.frame = frame
+
+        self.SetIcon(wx.Icon(settings.LOGO_PATH, wx.BITMAP_TYPE_ICON), settings.APP_NAME)
+
+        self.Bind(wx.EVT_MENU, self.OnTaskBarActivate, id=2)
+        self.Bind(wx.EVT_MENU, self.OnTaskBarDeactivate, id=3)
+        self.Bind(wx.EVT_MENU, self.OnTaskBarClose, id=4)
+        self.Bind(wx.EVT_MENU, self.OnTaskBarDumpMetrics, id=5)
+
+    def CreatePopupMenu(self):
+        menu = wx.Menu(settings.APP_NAME)
+        idx = 1
+        opening_task = self.frame.get_opening_task()
+        if not opening_task:
+            menu.Append(idx, "等待开番中")           
+        else:
+            menu.Append(idx, f"{opening_task.title} {self.frame.format_seconds(self.frame.opening_left_seconds(opening_task))}")   
+
+        menu.AppendSeparator()        
+
+        idx += 1
+        menu.Append(idx, '打开')
+
+        idx += 1
+        menu.Append(idx, '隐藏')
+
+        idx += 1
+        menu.Append(idx, '退出')
+
+        if metrics.enabled:
+            idx += 1
+            menu.Append(idx, '导出性能数据')
+
+        return menu
+
+    def OnTaskBarClose(self, event):
+        self.frame.Close()
+
+    def OnTaskBarDumpMetrics(self, event):
+        self.frame.dump_metrics()
+
+    def OnTaskBarActivate(self, event):
+        if not self.frame.IsShown():
+            self.frame.Show()
+            self.frame.Raise()
+
+    def OnTaskBarDeactivate(self, event):
+        if self.frame.IsShown():
+            self.frame.Hide()